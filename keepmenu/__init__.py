@@ -3,6 +3,7 @@ doesn't exist.
 
 """
 import configparser
+import json
 import locale
 import os
 import shlex
@@ -12,8 +13,6 @@ import sys
 import tempfile
 from os.path import exists, expanduser, join
 
-from keepmenu.menu import dmenu_err
-
 
 # Setup logging for debugging. Usage: logger.info(...)
 # import logging
@@ -43,7 +42,22 @@ def get_runtime_dir():
     return runtime_dir
 
 
-AUTH_FILE = join(get_runtime_dir(), ".keepmenu-auth")
+def __getattr__(name):
+    """Resolve AUTH_FILE on first use so importing keepmenu doesn't touch the
+    filesystem. SETTINGS defaults to the current CONF until reload_config()
+    is called.
+
+    """
+    if name == "AUTH_FILE":
+        globals()["AUTH_FILE"] = join(get_runtime_dir(), ".keepmenu-auth")
+        return globals()["AUTH_FILE"]
+    if name == "SETTINGS":
+        from keepmenu.settings import Settings  # pylint: disable=import-outside-toplevel
+        globals()["SETTINGS"] = Settings.from_config(CONF)[0]
+        return globals()["SETTINGS"]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 CONF_FILE = expanduser("~/.config/keepmenu/config.ini")
 SECRET_VALID_CHARS = "ABCDEFGHIJKLMNOPQRSTUVWXYZ234567"
 
@@ -56,12 +70,86 @@ MAX_LEN = 24
 CONF = configparser.ConfigParser()
 CLIPBOARD = False
 CLIPBOARD_CMD = "true"
+PROBE_FILE = "probes.json"
+PROBES = {}
+
+
+def load_probes(reprobe=False):
+    """Load cached capability probe results from the runtime directory
+
+    Args: reprobe - bool, discard cached results
+
+    """
+    global PROBES  # pylint: disable=global-statement
+    PROBES = {}
+    if reprobe:
+        return
+    try:
+        with open(join(get_runtime_dir(), PROBE_FILE), encoding=ENC) as pfile:
+            PROBES = json.load(pfile)
+    except (OSError, ValueError):
+        pass
+    if not isinstance(PROBES, dict):
+        PROBES = {}
+
+
+def save_probes():
+    """Persist capability probe results to the runtime directory
+
+    """
+    path = join(get_runtime_dir(), PROBE_FILE)
+    tmp = f"{path}.{os.getpid()}"
+    try:
+        fd_ = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with open(fd_, 'w', encoding=ENC) as pfile:
+            json.dump(PROBES, pfile)
+        os.replace(tmp, path)
+    except OSError:
+        pass
 
 
-def reload_config(conf_file = None):  # pylint: disable=too-many-statements,too-many-branches
+def probe(command, check=None, **kwargs):
+    """Check that a command can be executed. Results are cached in PROBES keyed
+    by the command and only re-run when $PATH, the display or the binary's
+    mtime changes.
+
+    Args: command - list of strings
+          check - optional function taking the CompletedProcess (output
+                  captured as bytes) and returning the probe result
+          kwargs - passed to subprocess.run
+    Returns: bool
+
+    """
+    binary = shutil.which(command[0])
+    try:
+        mtime = os.stat(binary).st_mtime_ns if binary else None
+    except OSError:
+        mtime = None
+    sig = [os.environ.get("PATH", ""), os.environ.get("WAYLAND_DISPLAY", ""),
+           os.environ.get("DISPLAY", ""), binary, mtime]
+    key = " ".join(shlex.quote(i) for i in command)
+    cached = PROBES.get(key)
+    if isinstance(cached, dict) and cached.get("sig") == sig:
+        return cached.get("ok") is True
+    res = False
+    if binary is not None:
+        try:
+            if check is None:
+                _ = run(command, check=False, stdout=DEVNULL, stderr=DEVNULL, **kwargs)
+                res = True
+            else:
+                res = bool(check(run(command, check=False, capture_output=True, **kwargs)))
+        except OSError:
+            pass
+    PROBES[key] = {"sig": sig, "ok": res}
+    return res
+
+
+def reload_config(conf_file = None, reprobe=False):  # pylint: disable=too-many-statements,too-many-branches
     """Reload config file. Primarly for use with tests and the --config flag.
 
     Args: conf_file - os.path
+          reprobe - bool, ignore cached clipboard/typing tool probe results
 
     """
     # pragma pylint: disable=global-statement,global-variable-not-assigned
@@ -69,11 +157,15 @@ def reload_config(conf_file = None):  # pylint: disable=too-many-statements,too-
         CACHE_PERIOD_DEFAULT_MIN, \
         CLIPBOARD_CMD, \
         CONF, \
+        SETTINGS, \
         MAX_LEN, \
         ENV, \
         ENC, \
         SEQUENCE
     # pragma pylint: enable=global-variable-undefined,global-variable-not-assigned
+    # pylint: disable=import-outside-toplevel
+    from keepmenu.menu import dmenu_err
+    from keepmenu.settings import Settings
     CONF = configparser.ConfigParser()
     conf_file = conf_file if conf_file is not None else CONF_FILE
     if not exists(conf_file):
@@ -95,47 +187,45 @@ def reload_config(conf_file = None):  # pylint: disable=too-many-statements,too-
             CONF.write(cfile)
     try:
         CONF.read(conf_file)
-    except configparser.ParsingError as err:
+    except configparser.Error as err:
         dmenu_err(f"Config file error: {err}")
         sys.exit()
-    if CONF.has_option('dmenu', 'dmenu_command'):
-        command = shlex.split(CONF.get('dmenu', 'dmenu_command'))
-    else:
+    if not CONF.has_option('dmenu', 'dmenu_command'):
         CONF.set('dmenu', 'dmenu_command', 'dmenu')
-        command = 'dmenu'
-    if "-l" in command:
-        MAX_LEN = int(command[command.index("-l") + 1])
-    if CONF.has_option("database", "pw_cache_period_min"):
-        CACHE_PERIOD_MIN = int(CONF.get("database", "pw_cache_period_min"))
-    else:
-        CACHE_PERIOD_MIN = CACHE_PERIOD_DEFAULT_MIN
     if CONF.has_option('database', 'autotype_default'):
         SEQUENCE = CONF.get("database", "autotype_default")
-    if CONF.has_option("database", "type_library"):
-        for typ in ["xdotool", "ydotool", "wtype", "dotool"]:
-            if CONF.get("database", "type_library") == typ:
-                try:
-                    _ = run([typ, "--version"], check=False, stdout=DEVNULL, stderr=DEVNULL)
-                except OSError:
-                    dmenu_err(f"{typ} not installed.\n"
-                              "Please install or remove that option from config.ini")
-                    sys.exit()
-        if CONF.get("database", "type_library") == "dotoolc":
-            if shutil.which("dotoolc") is None:
-                dmenu_err("dotoolc not installed.\n"
-                          "Please install or remove that option from config.ini")
-                sys.exit()
+    load_probes(reprobe)
+    probes = dict(PROBES)
+    settings, errors = Settings.from_config(CONF)
+    SETTINGS = settings
+    if settings.max_len is not None:
+        MAX_LEN = settings.max_len
+    CACHE_PERIOD_MIN = settings.cache_period_min
+    if CACHE_PERIOD_MIN is None:
+        CACHE_PERIOD_MIN = CACHE_PERIOD_DEFAULT_MIN
+    if errors:
+        dmenu_err("Config file error: " + " ".join(errors))
+    typ = SETTINGS.type_library
+    if typ in ("xdotool", "ydotool", "wtype", "dotool"):
+        if not probe([typ, "--version"]):
+            save_probes()
+            dmenu_err(f"{typ} not installed.\n"
+                      "Please install or remove that option from config.ini")
+            sys.exit()
+    elif typ == "dotoolc" and shutil.which("dotoolc") is None:
+        dmenu_err("dotoolc not installed.\n"
+                  "Please install or remove that option from config.ini")
+        sys.exit()
     if os.environ.get('WAYLAND_DISPLAY'):
         clips = ['wl-copy -o']
     else:
         clips = ["xsel -b", "xclip -l 1 -selection clip"]
     for clip in clips:
-        try:
-            _ = run(shlex.split(clip), check=False, stdout=DEVNULL, stderr=DEVNULL, input="")
+        if probe(shlex.split(clip), input=""):
             CLIPBOARD_CMD = clip
             break
-        except OSError:
-            continue
+    if PROBES != probes:
+        save_probes()
     if CLIPBOARD_CMD == "true":
         dmenu_err(f"{' or '.join([shlex.split(i)[0] for i in clips])} needed for clipboard support")
 
@@ -155,8 +245,12 @@ def safe_deref(entry, field):
         str: Dereferenced field value or empty string if None or error
 
     """
+    value = getattr(entry, field)
+    if not value or "{REF:" not in value:
+        return value or ""
+    from keepmenu.deref import resolve  # pylint: disable=import-outside-toplevel
     try:
-        return entry.deref(field) or ""
+        return resolve(entry, field) or ""
     except TypeError:
         # Handle case where referenced field is None
         return ""
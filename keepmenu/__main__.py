@@ -1,12 +1,16 @@
 """Main entrypoint and CLI parsing
 
+Only the modules needed to forward arguments to a running daemon are imported
+here. The menus, editing and database code are imported when the daemon starts
+or in one-shot --show mode.
+
 """
 import argparse
 import configparser
 from contextlib import closing
+import json
 import multiprocessing
 from multiprocessing import Event, Process, Pipe
-from getpass import getpass
 from multiprocessing.managers import BaseManager
 import os
 from os.path import exists, expanduser
@@ -17,7 +21,6 @@ from subprocess import call
 import sys
 
 import keepmenu
-from keepmenu.keepmenu import DmenuRunner
 
 # Python 3.14 changes the default to 'forkserver' on Linux.
 # Set to 'fork' for backward compatibility.
@@ -93,6 +96,8 @@ def client(port, auth):
     mgr.register('get_open_database_paths')
     mgr.register('get_config_passwordable_paths')
     mgr.register('receive_show_result')
+    mgr.register('get_cache_stats')
+    mgr.register('get_db_stats')
     mgr.connect()
 
     return mgr
@@ -164,6 +169,16 @@ class Server(Process):  # pylint: disable=too-many-instance-attributes
                 return list(self.shared_state.config_passwordable_paths)
             return []
 
+        def _get_cache_stats():
+            if self.shared_state:
+                return dict(self.shared_state.cache_stats)
+            return {}
+
+        def _get_db_stats():
+            if self.shared_state:
+                return dict(getattr(self.shared_state, 'db_stats', {}))
+            return {}
+
         mgr.register('set_event', callable=self.start_flag.set)
         mgr.register('get_pipe', callable=self._get_pipe)
         mgr.register('read_args_from_pipe', callable=self.args_flag.set)
@@ -173,6 +188,8 @@ class Server(Process):  # pylint: disable=too-many-instance-attributes
         mgr.register('get_open_database_paths', callable=_get_open_paths)
         mgr.register('get_config_passwordable_paths', callable=_get_config_paths)
         mgr.register('receive_show_result', callable=self.receive_show_result)
+        mgr.register('get_cache_stats', callable=_get_cache_stats)
+        mgr.register('get_db_stats', callable=_get_db_stats)
         mgr.start()  # pylint: disable=consider-using-with
         return mgr
 
@@ -181,12 +198,15 @@ def run(**kwargs):
     """Start the background Manager and Dmenu runner processes.
 
     """
+    from keepmenu.keepmenu import DmenuRunner  # pylint: disable=import-outside-toplevel
     # Create shared state manager for cross-process communication
     state_manager = multiprocessing.Manager()
     shared_state = state_manager.Namespace()
     shared_state.open_database_paths = []
     shared_state.config_passwordable_paths = []
     shared_state.current_database_path = None
+    shared_state.cache_stats = {}
+    shared_state.db_stats = {}
 
     server = None
     try:
@@ -211,6 +231,25 @@ def run(**kwargs):
     return dmenu
 
 
+def print_stats(port, auth):
+    """Print cache statistics and the memory use of each database of the
+    running daemon as JSON
+
+    """
+    if port_in_use(port) is False:
+        print("Keepmenu daemon is not running", file=sys.stderr)
+        sys.exit(1)
+    manager = client(port, auth)
+    stats = manager.get_cache_stats()  # pylint: disable=no-member
+    db_stats = manager.get_db_stats()  # pylint: disable=no-member
+    # AutoProxy objects need _getvalue() to get the actual dict
+    if hasattr(stats, '_getvalue'):
+        stats = stats._getvalue()
+    if hasattr(db_stats, '_getvalue'):
+        db_stats = db_stats._getvalue()
+    print(json.dumps({"result_cache": stats, "databases": db_stats}))
+
+
 def main():
     """Main script entrypoint
 
@@ -267,6 +306,24 @@ def main():
         help="TOTP mode",
     )
 
+    parser.add_argument(
+            "-g",
+            "--group",
+            type=str,
+            action="append",
+            required=False,
+            help="Only list entries in this group and its subgroups, e.g. Work/VPN. "
+                 "Can be given more than once",
+    )
+
+    parser.add_argument(
+            "-q",
+            "--query",
+            type=str,
+            required=False,
+            help="Only list entries matching this search, e.g. 'url:*.corp user:deploy'",
+    )
+
     parser.add_argument(
             "-s",
             "--show",
@@ -275,6 +332,32 @@ def main():
             help="Return password of matched entry",
     )
 
+    parser.add_argument(
+            "-u",
+            "--url",
+            type=str,
+            required=False,
+            help="Return password of the entry for this URL, e.g. https://login.example.com/",
+    )
+
+    parser.add_argument(
+            "-f",
+            "--fields",
+            type=str,
+            required=False,
+            help="Comma separated fields to return with --show/--show-batch, e.g. "
+                 "username,password,url,notes,totp,title,path,S:<attribute>",
+    )
+
+    parser.add_argument(
+            "--show-batch",
+            action="store_true",
+            default=False,
+            required=False,
+            help="Read search strings from stdin, one per line, and output "
+                 "JSON lines with the password of each matched entry",
+    )
+
     parser.add_argument(
             "-n",
             "--no-prompt",
@@ -284,12 +367,37 @@ def main():
             help="Do not prompt for database password",
     )
 
+    parser.add_argument(
+            "--reprobe",
+            action="store_true",
+            default=False,
+            required=False,
+            help="Ignore cached clipboard and typing tool checks and probe again",
+    )
+
+    parser.add_argument(
+            "--stats",
+            action="store_true",
+            default=False,
+            required=False,
+            help="Print --show result cache statistics and the memory use of each "
+                 "database of the running daemon as JSON",
+    )
+
     args = vars(parser.parse_args())
+    if args["show_batch"]:
+        args["show_batch"] = [i.strip() for i in sys.stdin if i.strip()]
+        if not args["show_batch"]:
+            return
+    show = args["show"] or args["show_batch"] or args["url"]
 
     port, auth = get_auth()
-    if port_in_use(port) is False and not args["show"]:
+    if args.pop("stats"):
+        print_stats(port, auth)
+        return
+    if port_in_use(port) is False and not show:
         run(**args)
-    elif port_in_use(port) is False and args["show"]:
+    elif port_in_use(port) is False and show:
         # If no server is running, just run directly in one-shot mode
         from keepmenu.run_once import run_once
         password = run_once(**args)
@@ -300,7 +408,7 @@ def main():
     try:
         manager = client(port, auth)
         conn = manager.get_pipe()  # pylint: disable=no-member
-        if args["show"] and args.get("database"):
+        if show and args.get("database"):
             req_path = os.path.realpath(os.path.expanduser(args["database"]))
             try:
                 open_paths_result = manager.get_open_database_paths()
@@ -313,6 +421,7 @@ def main():
 
             if (req_path not in open_paths) and (req_path not in cfg_pw_paths) and not args.get("no_prompt"):
                 # Prompt in client context
+                from getpass import getpass  # pylint: disable=import-outside-toplevel
                 args["password"] = getpass()
 
         if args.get('totp'):
@@ -321,7 +430,7 @@ def main():
             conn.send(args)
             manager.read_args_from_pipe()  # pylint: disable=no-member
         manager.set_event()  # pylint: disable=no-member
-        if args["show"]:
+        if show:
             # Wait for daemon to process and send back result through pipe
             result = manager.receive_show_result()  # pylint: disable=no-member
             # AutoProxy objects need _getvalue() to get the actual string
@@ -0,0 +1,139 @@
+"""Memoized resolution of KeePass field references ({REF:U@I:<uuid>})
+
+pykeepass resolves every reference with a search of the whole XML tree. The
+resolved values are cached here per database, together with a reverse
+dependency map so that changing an entry invalidates exactly the entries that
+reference it, directly or through other references.
+
+"""
+import re
+import uuid
+import weakref
+
+REF_RE = re.compile(r'({REF:([TUPANI])@([TUPANI]):([^}]+)})')
+REF_FIELDS = {'T': 'title',
+              'U': 'username',
+              'P': 'password',
+              'A': 'url',
+              'N': 'notes',
+              'I': 'uuid'}
+# One DerefCache per open PyKeePass object
+CACHES = weakref.WeakKeyDictionary()
+
+
+class DerefCache:
+    """Resolved reference values of one database
+
+        values - dict {(entry uuid, field): (raw value, resolved value)}
+        rdeps - dict {target uuid: set of (entry uuid, field) referencing it}
+        searched - set of (entry uuid, field) using references by something
+                   other than uuid. These are dropped on every change.
+
+    The PyKeePass object isn't stored: CACHES is keyed by it weakly, and a
+    strong reference from the value would keep it alive forever. References
+    are looked up in the database of the entry being resolved.
+
+    """
+    def __init__(self):
+        self.values = {}
+        self.rdeps = {}
+        self.searched = set()
+
+    def resolve(self, entry, field, _stack=()):
+        """Return the value of an entry field with all references resolved
+
+        Args: entry - Entry object
+              field - string, 'title', 'username', 'password', 'url' or 'notes'
+        Returns: string or None if a reference can't be resolved or is part of
+                 a reference cycle
+
+        """
+        key = (entry.uuid, field)
+        raw = getattr(entry, field)
+        cached = self.values.get(key)
+        if cached is not None and cached[0] == raw:
+            return cached[1]
+        if key in _stack:
+            return None
+        kpo = entry._kp  # pylint: disable=protected-access
+        value = raw
+        for ref, wanted, search_in, search_value in set(REF_RE.findall(raw or "")):
+            wanted, search_in = REF_FIELDS[wanted], REF_FIELDS[search_in]
+            target = None
+            if search_in == 'uuid':
+                try:
+                    target_uuid = uuid.UUID(search_value)
+                except ValueError:
+                    target_uuid = None
+                if target_uuid is not None:
+                    # Also recorded when missing so adding the target resolves it
+                    self.rdeps.setdefault(target_uuid, set()).add(key)
+                    target = kpo.find_entries(uuid=target_uuid, first=True)
+            else:
+                self.searched.add(key)
+                target = kpo.find_entries(first=True, **{search_in: search_value})
+                if target is not None:
+                    self.rdeps.setdefault(target.uuid, set()).add(key)
+            if target is None or wanted == 'uuid':
+                value = None
+                break
+            resolved = self.resolve(target, wanted, _stack + (key,))
+            if resolved is None:
+                value = None
+                break
+            value = value.replace(ref, resolved)
+        self.values[key] = (raw, value)
+        return value
+
+    def invalidate(self, entry_uuid):
+        """Drop the cached values of an entry and of every entry referencing
+        it
+
+        Args: entry_uuid - uuid.UUID of the added, edited or deleted entry
+        Returns: set of uuids of the entries whose cached values were dropped
+
+        """
+        changed = set()
+        pending = [entry_uuid]
+        while pending:
+            current = pending.pop()
+            if current in changed:
+                continue
+            changed.add(current)
+            for key in [i for i in self.values if i[0] == current]:
+                del self.values[key]
+            pending.extend(i[0] for i in self.rdeps.pop(current, ()))
+        for key in self.searched:
+            self.values.pop(key, None)
+            changed.add(key[0])
+        self.searched = set()
+        return changed
+
+
+def get_cache(kpo):
+    """Return the DerefCache of a database, creating it on first use
+
+    """
+    cache = CACHES.get(kpo)
+    if cache is None:
+        cache = CACHES[kpo] = DerefCache()
+    return cache
+
+
+def resolve(entry, field):
+    """Resolve the references in an entry field through its database's cache
+
+    """
+    return get_cache(entry._kp).resolve(entry, field)  # pylint: disable=protected-access
+
+
+def invalidate(entry):
+    """Invalidate cached references after an entry was added, edited or
+    deleted
+
+    Returns: set of uuids of the entries whose resolved values may have changed
+
+    """
+    return get_cache(entry._kp).invalidate(entry.uuid)  # pylint: disable=protected-access
+
+# vim: set et ts=4 sw=4 :
@@ -6,13 +6,13 @@ import os
 import random
 from secrets import choice
 import shlex
-import string
 from subprocess import call
 import tempfile
 from urllib import parse
 
 import keepmenu
-from keepmenu.menu import dmenu_select, dmenu_err
+from keepmenu.groups import browse_group
+from keepmenu.menu import dmenu_select, dmenu_err, launcher_session
 from keepmenu.totp import gen_otp, get_otp_url, TOTP_FIELDS
 from keepmenu.type import type_text
 
@@ -33,13 +33,14 @@ def add_entry(kpo):
              Keepass Entry object on success
 
     """
-    group = select_group(kpo)
-    if group is False:
-        return False
-    entry = kpo.add_entry(destination_group=group, title="", username="", password="")
-    edit = True
-    while edit is True:
-        edit = edit_entry(kpo, entry)
+    with launcher_session():
+        group = select_group(kpo)
+        if group is False:
+            return False
+        entry = kpo.add_entry(destination_group=group, title="", username="", password="")
+        edit = True
+        while edit is True:
+            edit = edit_entry(kpo, entry)
     return entry
 
 
@@ -424,29 +425,7 @@ def get_password_chars():
     Returns: Dict {preset_name_1: {char_set_1: string, char_set_2: string},
                    preset_name_2: ....}
     """
-    chars = {"upper": string.ascii_uppercase,
-             "lower": string.ascii_lowercase,
-             "digits": string.digits,
-             "punctuation": string.punctuation}
-    presets = {}
-    presets["Letters+Digits+Punctuation"] = chars
-    presets["Letters+Digits"] = {k: chars[k] for k in ("upper", "lower", "digits")}
-    presets["Letters"] = {k: chars[k] for k in ("upper", "lower")}
-    presets["Digits"] = {k: chars[k] for k in ("digits",)}
-    if keepmenu.CONF.has_section('password_chars'):
-        pw_chars = dict(keepmenu.CONF.items('password_chars'))
-        chars.update(pw_chars)
-        for key, val in pw_chars.items():
-            presets[key.title()] = {k: chars[k] for k in (key,)}
-    if keepmenu.CONF.has_section('password_char_presets'):
-        if keepmenu.CONF.options('password_char_presets'):
-            presets = {}
-        for name, val in keepmenu.CONF.items('password_char_presets'):
-            try:
-                presets[name.title()] = {k: chars[k] for k in shlex.split(val)}
-            except KeyError:
-                print(f"Error: Unknown value in preset {name}. Ignoring.")
-                continue
+    presets = {k: dict(v) for k, v in keepmenu.SETTINGS.password_presets}
     inp = "\n".join(presets)
     char_sel = dmenu_select(len(presets),
                             "Pick character set(s) to use", inp=inp)
@@ -465,6 +444,8 @@ def select_group(kpo, prompt="Groups", exclude_group=None):
              group - Group object
 
     """
+    if keepmenu.SETTINGS.group_browser:
+        return browse_group(kpo, prompt, exclude_group)
     groups = kpo.groups
     if exclude_group is not None:
         exclude_path = exclude_group.path
@@ -495,24 +476,27 @@ def manage_groups(kpo):
                'Rename',
                'Delete']
     group = False
-    while edit is True:
-        inp = "\n".join(i for i in options) + "\n\n" + \
-            "\n".join("/".join(i.path) for i in kpo.groups)
-        sel = dmenu_select(len(options) + min(keepmenu.MAX_LEN, len(kpo.groups)) + 1,
-                           "Groups",
-                           inp=inp)
-        if not sel:
-            edit = False
-        elif sel == 'Create':
-            group = create_group(kpo)
-        elif sel == 'Move':
-            group = move_group(kpo)
-        elif sel == 'Rename':
-            group = rename_group(kpo)
-        elif sel == 'Delete':
-            group = delete_group(kpo)
-        else:
-            edit = False
+    with launcher_session():
+        while edit is True:
+            # The browser lists the groups when one is selected
+            groups = [] if keepmenu.SETTINGS.group_browser else kpo.groups
+            inp = "\n".join(i for i in options) + "\n\n" + \
+                "\n".join("/".join(i.path) for i in groups)
+            sel = dmenu_select(len(options) + min(keepmenu.MAX_LEN, len(groups)) + 1,
+                               "Groups",
+                               inp=inp)
+            if not sel:
+                edit = False
+            elif sel == 'Create':
+                group = create_group(kpo)
+            elif sel == 'Move':
+                group = move_group(kpo)
+            elif sel == 'Rename':
+                group = rename_group(kpo)
+            elif sel == 'Delete':
+                group = delete_group(kpo)
+            else:
+                edit = False
     return group
 
 
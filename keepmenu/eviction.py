@@ -0,0 +1,126 @@
+"""Idle time and memory use of unlocked databases, to lock the cold ones
+
+The size of a database is estimated from its XML tree: libxml2 allocates a
+node struct for every element, attribute and text node, plus the text.
+Attachments are counted at their decoded size. The tree is walked rather than
+serialized so no copy of the whole database, secrets included, is made. It is
+an estimate of the memory freed by locking the database, not an exact measure.
+
+"""
+import time
+
+# Approximate size of a libxml2 xmlNode on 64 bit platforms
+NODE_BYTES = 120
+
+
+def estimate_size(kpo):
+    """Return the estimated memory use of an unlocked database in bytes
+
+    Args: kpo - PyKeePass object
+
+    """
+    nodes = 0
+    size = 0
+    for elem in kpo.tree.iter():
+        nodes += 1 + len(elem.attrib)
+        size += sum(len(k) + len(v) for k, v in elem.attrib.items())
+        for text in (elem.text, elem.tail):
+            if text:
+                nodes += 1
+                size += len(text)
+    size += nodes * NODE_BYTES
+    try:
+        size += sum(len(i) for i in kpo.binaries)
+    except (AttributeError, TypeError):
+        pass
+    return size
+
+
+class DatabaseUsage:
+    """Last use and estimated size of each unlocked database
+
+        used - dict {database path: time.monotonic() of the last use}
+        sizes - dict {database path: (PyKeePass object, bytes)}
+
+    """
+    def __init__(self):
+        self.used = {}
+        self.sizes = {}
+
+    def touch(self, dbo, now=None):
+        """Record a use of a database
+
+        Args: dbo - DataBase object
+
+        """
+        self.used[dbo.dbase] = time.monotonic() if now is None else now
+
+    def size(self, dbo):
+        """Return the estimated size of an unlocked database, computed once
+        per PyKeePass object and after changed()
+
+        """
+        kpo, size = self.sizes.get(dbo.dbase, (None, 0))
+        if kpo is not dbo.kpo:
+            size = estimate_size(dbo.kpo)
+            self.sizes[dbo.dbase] = (dbo.kpo, size)
+        return size
+
+    def changed(self, dbase):
+        """Recompute the size of a database after it was edited
+
+        """
+        self.sizes.pop(dbase, None)
+
+    def forget(self, dbase):
+        """Drop a locked database
+
+        """
+        self.used.pop(dbase, None)
+        self.sizes.pop(dbase, None)
+
+    def victims(self, dbs, keep, idle=0, budget=0, now=None):
+        """Return the databases to lock: the ones unused for longer than idle,
+        then the least recently used ones until the others fit in budget
+
+        Args: dbs - list of DataBase objects
+              keep - database path that is never locked
+              idle - seconds, 0 for no idle limit
+              budget - bytes, 0 for no memory limit
+        Returns: list of DataBase objects
+
+        """
+        now = time.monotonic() if now is None else now
+        unlocked = [i for i in dbs if i.kpo is not None]
+        cold = sorted((i for i in unlocked if i.dbase != keep),
+                      key=lambda i: self.used.get(i.dbase, now))
+        res = {i.dbase: i for i in cold
+               if idle and now - self.used.get(i.dbase, now) > idle}
+        if budget:
+            total = sum(self.size(i) for i in unlocked if i.dbase not in res)
+            for dbo in cold:
+                if total <= budget:
+                    break
+                if dbo.dbase not in res:
+                    res[dbo.dbase] = dbo
+                    total -= self.size(dbo)
+        return list(res.values())
+
+    def stats(self, dbs, now=None):
+        """Return the memory use of each database for `keepmenu --stats`
+
+        Args: dbs - list of DataBase objects
+        Returns: dict {database path: {"unlocked": bool, "bytes": int,
+                                       "idle_s": int or None}}
+
+        """
+        now = time.monotonic() if now is None else now
+        res = {}
+        for dbo in dbs:
+            used = self.used.get(dbo.dbase)
+            res[dbo.dbase] = {"unlocked": dbo.kpo is not None,
+                              "bytes": self.size(dbo) if dbo.kpo is not None else 0,
+                              "idle_s": None if used is None else int(now - used)}
+        return res
+
+# vim: set et ts=4 sw=4 :
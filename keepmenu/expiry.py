@@ -0,0 +1,94 @@
+"""Index of entry expiry times
+
+"""
+from datetime import datetime, timedelta
+from heapq import heapify, heappop, heappush
+from itertools import count
+from threading import RLock
+
+# Entries expiring within this period are listed as expiring
+EXPIRY_HORIZON = timedelta(days=3)
+
+
+class ExpiryIndex:
+    """Expired and soon expiring entries of one database
+
+    Entries that expire later are kept in a min-heap of expiry timestamps and
+    moved to the expiring set when they come within EXPIRY_HORIZON, so keeping
+    the list current costs O(log n) per entry instead of a rescan. Updated or
+    removed entries leave stale heap items behind that are skipped when
+    popped.
+
+    Args: entries - list of KeePass entries
+
+    """
+    def __init__(self, entries):
+        self._lock = RLock()
+        self._counter = count()
+        self._order = {}
+        self._times = {}
+        self._expiring = {}
+        self._heap = []
+        now = self._horizon()
+        for entry in entries:
+            self._order[entry.uuid] = next(self._counter)
+            if entry.expires is True:
+                timestamp = entry.expiry_time.timestamp()
+                if timestamp < now:
+                    self._expiring[entry.uuid] = entry
+                else:
+                    self._times[entry.uuid] = timestamp
+                    self._heap.append((timestamp, self._order[entry.uuid], entry))
+        heapify(self._heap)
+
+    @staticmethod
+    def _horizon():
+        return (datetime.now() + EXPIRY_HORIZON).timestamp()
+
+    def refresh(self):
+        """Move the entries that came within the horizon to the expiring set
+
+        """
+        with self._lock:
+            horizon = self._horizon()
+            while self._heap and self._heap[0][0] < horizon:
+                timestamp, _, entry = heappop(self._heap)
+                if self._times.get(entry.uuid) == timestamp:
+                    del self._times[entry.uuid]
+                    self._expiring[entry.uuid] = entry
+
+    def update(self, entry):
+        """Add an entry or refresh it after its expiry was edited
+
+        """
+        with self._lock:
+            self._order.setdefault(entry.uuid, next(self._counter))
+            self._times.pop(entry.uuid, None)
+            self._expiring.pop(entry.uuid, None)
+            if entry.expires is not True:
+                return
+            timestamp = entry.expiry_time.timestamp()
+            if timestamp < self._horizon():
+                self._expiring[entry.uuid] = entry
+            else:
+                self._times[entry.uuid] = timestamp
+                heappush(self._heap, (timestamp, next(self._counter), entry))
+
+    def remove(self, entry):
+        """Remove a deleted entry
+
+        """
+        with self._lock:
+            self._times.pop(entry.uuid, None)
+            self._expiring.pop(entry.uuid, None)
+            self._order.pop(entry.uuid, None)
+
+    def expiring(self):
+        """Return the expired and soon expiring entries in database order
+
+        """
+        with self._lock:
+            self.refresh()
+            return sorted(self._expiring.values(), key=lambda i: self._order[i.uuid])
+
+# vim: set et ts=4 sw=4 :
@@ -0,0 +1,122 @@
+"""Usage based (frecency) ordering of entries
+
+Each selection of an entry adds 1 to its score, and scores decay with a half
+life of HALF_LIFE_DAYS, so often and recently used entries sort first. Only
+database paths, entry uuids, scores and timestamps are stored, never titles or
+secrets.
+
+"""
+import json
+import os
+from os.path import expanduser, join
+import time
+
+HALF_LIFE_DAYS = 7
+MAX_ENTRIES = 1000
+
+
+def get_state_dir():
+    """Return the state directory, $XDG_STATE_HOME/keepmenu or
+    ~/.local/state/keepmenu
+
+    """
+    state = os.environ.get('XDG_STATE_HOME') or expanduser("~/.local/state")
+    return join(state, 'keepmenu')
+
+
+class FrecencyStore:
+    """Entry usage scores persisted as JSON
+
+    {database path: {uuid hex: [score, timestamp of last use]}}
+
+    Args: path - file path, defaults to frecency.json in the state directory
+
+    """
+    def __init__(self, path=None):
+        self.path = path or join(get_state_dir(), "frecency.json")
+        self.data = {}
+        self._mtime = None
+
+    def load(self):
+        """Read the store if the file changed since it was last read
+
+        """
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            return
+        if mtime == self._mtime:
+            return
+        try:
+            with open(self.path, encoding="utf-8") as sfile:
+                data = json.load(sfile)
+        except (OSError, ValueError):
+            return
+        self.data = data if isinstance(data, dict) else {}
+        self._mtime = mtime
+
+    def save(self):
+        """Write the store atomically, readable only by the user
+
+        """
+        os.makedirs(os.path.dirname(self.path), mode=0o700, exist_ok=True)
+        tmp = f"{self.path}.{os.getpid()}"
+        try:
+            fd_ = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with open(fd_, 'w', encoding="utf-8") as sfile:
+                json.dump(self.data, sfile)
+            os.replace(tmp, self.path)
+            self._mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            pass
+
+    @staticmethod
+    def _decay(score, last, now):
+        return score * 0.5 ** ((now - last) / (HALF_LIFE_DAYS * 86400))
+
+    def record(self, dbase, entry, now=None, save=True):
+        """Record a selection of an entry
+
+        Args: dbase - database path
+              entry - Entry object
+              save - bool, write the store. Callers recording several
+                     selections pass False and call save() once.
+
+        """
+        now = time.time() if now is None else now
+        self.load()
+        scores = self.data.setdefault(dbase, {})
+        score, last = scores.get(entry.uuid.hex, (0, now))
+        scores[entry.uuid.hex] = [self._decay(score, last, now) + 1, now]
+        if len(scores) > MAX_ENTRIES:
+            for key in sorted(scores, key=lambda i: self._decay(*scores[i], now))[:-MAX_ENTRIES]:
+                del scores[key]
+        if save:
+            self.save()
+
+    def order(self, dbase, entries, now=None):
+        """Return the indexes of entries sorted by score. Entries with equal
+        scores, e.g. never used, keep their order.
+
+        Args: dbase - database path, or a list with the database path of
+                      each entry
+              entries - list of Entry objects
+        Returns: list of int
+
+        """
+        now = time.time() if now is None else now
+        self.load()
+        dbases = [dbase] * len(entries) if isinstance(dbase, str) else dbase
+        if not any(self.data.get(i) for i in set(dbases)):
+            return list(range(len(entries)))
+        current = []
+        for path, entry in zip(dbases, entries):
+            scores = self.data.get(path, {})
+            current.append(self._decay(*scores[entry.uuid.hex], now)
+                           if entry.uuid.hex in scores else 0)
+        return sorted(range(len(entries)), key=lambda i: -current[i])
+
+
+STORE = FrecencyStore()
+
+# vim: set et ts=4 sw=4 :
@@ -0,0 +1,86 @@
+"""Group hierarchy index for drill-down menus
+
+"""
+import keepmenu
+from keepmenu.menu import dmenu_select
+
+# Menu line to go to the parent group
+UP = ".."
+
+
+class GroupTree:
+    """Parent -> children index of the groups of one database, built with one
+    walk of the group tree so each menu level is a dict lookup
+
+        root - root Group
+        children - dict {group uuid: list of subgroups}
+        parents - dict {group uuid: parent Group}
+
+    Args: kpo - PyKeePass object
+
+    """
+    def __init__(self, kpo):
+        self.root = kpo.root_group
+        self.children = {}
+        self.parents = {}
+        pending = [self.root]
+        while pending:
+            group = pending.pop()
+            subgroups = group.subgroups
+            self.children[group.uuid] = subgroups
+            for sub in subgroups:
+                self.parents[sub.uuid] = group
+            pending.extend(subgroups)
+
+    def index_entries(self, kp_entries, order):
+        """Sort entries into their groups
+
+        Args: kp_entries - list of Entry objects
+              order - sequence of indexes of kp_entries in display order
+        Returns: (dict {group uuid: list of indexes of its entries in order},
+                  dict {group uuid: number of entries in the group and its
+                        subgroups})
+
+        """
+        members = {}
+        counts = {}
+        for idx in order:
+            group = kp_entries[idx].parentgroup
+            members.setdefault(group.uuid, []).append(idx)
+            while group is not None:
+                counts[group.uuid] = counts.get(group.uuid, 0) + 1
+                group = self.parents.get(group.uuid)
+        return members, counts
+
+
+def browse_group(kpo, prompt="Groups", exclude_group=None):
+    """Select a group by drilling down from the root group, one level per
+    menu
+
+    Args: kpo - Keepass object
+          prompt - dmenu prompt
+          exclude_group - Group to exclude (along with its descendants)
+
+    Returns: False for no group
+             group - Group object
+
+    """
+    tree = GroupTree(kpo)
+    stack = [tree.root]
+    while True:
+        group = stack[-1]
+        here = f"[{'/'.join(group.path) or 'Root'}]"
+        labels = {f"{i.name}/": i for i in tree.children.get(group.uuid, [])
+                  if exclude_group is None or i.uuid != exclude_group.uuid}
+        lines = [here] + ([UP] if len(stack) > 1 else []) + list(labels)
+        sel = dmenu_select(min(keepmenu.MAX_LEN, len(lines)), prompt, inp="\n".join(lines))
+        if sel == here:
+            return group
+        if sel == UP and len(stack) > 1:
+            stack.pop()
+        elif sel in labels:
+            stack.append(labels[sel])
+        else:
+            return False
+
+# vim: set et ts=4 sw=4 :
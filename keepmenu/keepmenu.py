@@ -1,27 +1,37 @@
 """Read and copy Keepass database entries using dmenu style launchers
 
 """
+from concurrent.futures import ThreadPoolExecutor
 from copy import copy
 from dataclasses import dataclass
-from datetime import datetime, timedelta
 import errno
 import functools
 from getpass import getpass
 from multiprocessing import Process
+import os
 from os.path import expanduser, isfile, realpath
-import shlex
+from queue import Empty, Queue
 import subprocess
 import sys
 from threading import Timer
 
-import construct
 import keepmenu
+from keepmenu import deref, frecency, passcmd
+from keepmenu.deref import invalidate as invalidate_refs
+from keepmenu.expiry import ExpiryIndex
+from keepmenu.eviction import DatabaseUsage
 from keepmenu.edit import add_entry, create_db, edit_entry, manage_groups
-from keepmenu.menu import dmenu_err, dmenu_select
+from keepmenu.menu import dmenu_err, dmenu_select, launcher_session
+from keepmenu.query import CachedIndex, EntryIndex, MergedIndex, ResultCache, UrlIndex
+from keepmenu.settings import ConfigWatcher
 from keepmenu.type import type_entry, type_text
 from keepmenu.view import view_all_entries, view_entry
+from keepmenu.window import active_title, WindowIndex
 from keepmenu.totp import gen_otp, get_otp_url
 
+# Seconds between checks for idle databases while no menu is shown
+EVICT_CHECK_SEC = 60
+
 
 @dataclass
 class DataBase:
@@ -49,9 +59,12 @@ class DataBase:
         self.kfile = realpath(expanduser(self.kfile)) if self.kfile else ""
 
 
-def get_databases():
+def get_databases(resolve=True):
     """Read databases from config
 
+    Args: resolve - bool, run the password_cmd_n commands. If False, pword is
+                    only set from password_n; use resolve_passwords for the
+                    database actually being opened.
     Returns: [DataBase obj, DataBase obj2,...]
              If not specified in the config, the value will be None
              If database name is None, an error has occurred
@@ -76,26 +89,56 @@ def get_databases():
             autotype = args_dict[f'autotype_default_{idx}']
         except KeyError:
             autotype = None
-        try:
-            cmd = expanduser(args_dict[f'password_cmd_{idx}'])
-            res = subprocess.run(shlex.split(cmd),
-                                 capture_output=True,
-                                 check=False,
-                                 encoding=keepmenu.ENC)
-            if res.stderr:
-                dmenu_err(f"Password command error: {res.stderr}")
-                sys.exit()
-            else:
-                passw = res.stdout.rstrip('\n') if res.stdout else passw
-        except KeyError:
-            pass
         if dbn:
             dbo = DataBase(dbase=dbn, kfile=keyfile, pword=passw, atype=autotype)
             dbs.append(dbo)
-
+    if resolve:
+        resolve_passwords(dbs)
     return dbs
 
 
+def password_commands():
+    """Read the password commands from config
+
+    Returns: dict {database path: password_cmd}
+
+    """
+    args_dict = dict(keepmenu.CONF.items('database'))
+    cmds = {}
+    for key, dbn in args_dict.items():
+        idx = key.rsplit('_', 1)[-1]
+        if key.startswith('database') and dbn and f'password_cmd_{idx}' in args_dict:
+            cmds[DataBase(dbase=dbn).dbase] = expanduser(args_dict[f'password_cmd_{idx}'])
+    return cmds
+
+
+def resolve_passwords(dbs, quiet=False):
+    """Set the password of databases that have a password_cmd_n from the
+    command output. The commands run concurrently and their output is cached
+    for password_cmd_cache_min minutes.
+
+    Args: dbs - list of DataBase objects
+          quiet - bool, skip databases whose command failed instead of
+                  showing the error and exiting
+
+    """
+    cmds = password_commands()
+    needed = [cmds[i.dbase] for i in dbs if i.dbase in cmds]
+    if not needed:
+        return
+    ttl = keepmenu.SETTINGS.password_cmd_cache_min
+    ttl = keepmenu.CACHE_PERIOD_MIN if ttl is None else ttl
+    res = passcmd.CACHE.run(needed, ttl * 60)
+    errors = [err for _, err in res.values() if err]
+    if errors and not quiet:
+        dmenu_err(f"Password command error: {errors[0]}")
+        sys.exit()
+    for dbo in dbs:
+        stdout, stderr = res.get(cmds.get(dbo.dbase), ("", ""))
+        if stdout and not stderr:
+            dbo.pword = stdout
+
+
 def get_database(open_databases=None, cli=False, no_prompt=False, **kwargs):
     # pylint: disable=too-many-statements,too-many-branches
     """Read databases/keyfile/autotype from config, CLI, or ask for user input.
@@ -110,7 +153,7 @@ def get_database(open_databases=None, cli=False, no_prompt=False, **kwargs):
                 DmenuRunner for persistence instead of using a global var)
 
     """
-    dbs_cfg = get_databases()
+    dbs_cfg = get_databases(resolve=False)
     dbs_cfg_n = [i.dbase for i in dbs_cfg]
     open_databases = open_databases or {}
     clidb = DataBase(dbase=kwargs.get('database'),
@@ -175,6 +218,9 @@ def get_database(open_databases=None, cli=False, no_prompt=False, **kwargs):
     elif cli and len(dbs) > 1:
         print("Specify database with -d", file=sys.stderr)
         return None, open_databases
+    if dbs[0].kpo is None and clidb.pword is None:
+        # Only run the password command of the database being opened
+        resolve_passwords(dbs[:1])
     if dbs[0].pword is None:
         if no_prompt:
             return None, open_databases
@@ -183,9 +229,11 @@ def get_database(open_databases=None, cli=False, no_prompt=False, **kwargs):
             return None, open_databases
     if dbs[0].kpo is None:
         dbs[0].kpo = get_entries(dbs[0], cli_mode=cli)
+        if dbs[0].kpo is None and dbs[0].dbase in password_commands():
+            passcmd.CACHE.forget(password_commands()[dbs[0].dbase])
     for db_ in open_databases.values():
         db_.is_active = False
-    if dbs[0].dbase not in open_databases:
+    if dbs[0].dbase not in open_databases or open_databases[dbs[0].dbase].kpo is None:
         open_databases[dbs[0].dbase] = copy(dbs[0])
     if dbs[0].dbase in dbs_cfg_n:
         db_cfg_atype = dbs_cfg[dbs_cfg_n.index(dbs[0].dbase)].atype
@@ -238,12 +286,13 @@ def get_entries(dbo, cli_mode=False):
         Returns: PyKeePass object or None
 
     """
+    from construct.core import ChecksumError  # pylint: disable=import-outside-toplevel
     from pykeepass import PyKeePass  # pylint: disable=import-outside-toplevel
     if dbo.dbase is None:
         return None
     try:
         kpo = PyKeePass(dbo.dbase, dbo.pword, keyfile=dbo.kfile)
-    except (FileNotFoundError, construct.core.ChecksumError) as err:
+    except (FileNotFoundError, ChecksumError) as err:
         if str(err.args[0]).startswith("wrong checksum"):
             if cli_mode:
                 print("Error: Invalid Password or keyfile", file=sys.stderr)
@@ -274,6 +323,23 @@ def get_entries(dbo, cli_mode=False):
     return kpo
 
 
+def unlock_database(dbo):
+    """Open a database in the background, without prompting or showing
+    errors. Failures are left for the normal unlock path to report when the
+    database is selected.
+
+    Args: dbo - DataBase object with a password
+    Returns: dbo with kpo set, or None
+
+    """
+    from pykeepass import PyKeePass  # pylint: disable=import-outside-toplevel
+    try:
+        dbo.kpo = PyKeePass(dbo.dbase, dbo.pword, keyfile=dbo.kfile)
+    except Exception:  # pylint: disable=broad-except
+        return None
+    return dbo
+
+
 def get_passphrase(check=False, cli=False):
     """Get a database password from dmenu, pinentry or on the CLI
 
@@ -304,12 +370,7 @@ def get_expiring_entries(entries):
     """Return a list of expired entries or that will expire in the next 3 days (if they can expire)
 
     """
-    expiring = []
-    for entry in entries:
-        if entry.expires is True and \
-                entry.expiry_time.timestamp() < (datetime.now() + timedelta(days=3)).timestamp():
-            expiring.append(entry)
-    return expiring
+    return ExpiryIndex(entries).expiring()
 
 
 class DmenuRunner(Process):
@@ -322,8 +383,10 @@ class DmenuRunner(Process):
     def __init__(self, server, shared_state=None, **kwargs):
         Process.__init__(self)
         cfile = kwargs.get('config')
+        self.conf_file = None if cfile is None else expanduser(cfile)
         keepmenu.CLIPBOARD = kwargs.get('clipboard', False)
-        keepmenu.reload_config(None if cfile is None else expanduser(cfile))
+        keepmenu.reload_config(self.conf_file, reprobe=kwargs.get('reprobe', False))
+        self.config_watcher = ConfigWatcher(self.conf_file or keepmenu.CONF_FILE)
         self.server = server
         self.shared_state = shared_state
         self.database, self.open_databases = get_database(**kwargs)
@@ -331,8 +394,25 @@ class DmenuRunner(Process):
         if not self.database or not self.database.kpo:
             self.server.kill_flag.set()
             sys.exit()
-        self.expiring = get_expiring_entries(self.database.kpo.entries)
         self.prev_entry = None
+        self.expiry_indexes = {}
+        self.indexes = {}
+        self.generations = {}
+        self.result_cache = ResultCache()
+        self.window_indexes = {}
+        self.url_indexes = {}
+        self.unlock_pool = None
+        self.unlocked = Queue()
+        self.usage = DatabaseUsage()
+        self.scope = self._get_scope(kwargs)
+
+    @staticmethod
+    def _get_scope(kwargs):
+        """Return the (groups, query) scope of an invocation from the --group
+        and --query arguments
+
+        """
+        return (tuple(kwargs.pop('group', None) or ()), kwargs.pop('query', None) or "")
 
     def _set_timer(self):
         """Set inactivity timer
@@ -343,10 +423,265 @@ class DmenuRunner(Process):
         self.cache_timer.daemon = True
         self.cache_timer.start()
 
+    def _get_index(self, dbo):
+        """Return the search index for a database, building it on first use or
+        after the database was reopened
+
+        Args: dbo - DataBase object
+        Returns: EntryIndex
+
+        """
+        kpo, index = self.indexes.get(dbo.dbase, (None, None))
+        if index is None or kpo is not dbo.kpo or \
+                index.fulltext != keepmenu.SETTINGS.fulltext_search:
+            index = EntryIndex(dbo.kpo.entries)
+            self.indexes[dbo.dbase] = (dbo.kpo, index)
+            self._bump_generation(dbo.dbase)
+        return index
+
+    def _get_url_index(self, dbo):
+        """Return the URL index for a database, building it on first use or
+        after the database was reopened
+
+        """
+        kpo, index = self.url_indexes.get(dbo.dbase, (None, None))
+        if index is None or kpo is not dbo.kpo:
+            index = UrlIndex(dbo.kpo.entries)
+            self.url_indexes[dbo.dbase] = (dbo.kpo, index)
+        return index
+
+    @property
+    def expiring(self):
+        """Expired and soon expiring entries of the current database
+
+        """
+        return self._get_expiry_index().expiring()
+
+    def _get_expiry_index(self, dbo=None):
+        """Return the expiry index of a database, by default the current one,
+        building it on first use or after the database was reopened
+
+        Returns: ExpiryIndex
+
+        """
+        dbo = dbo or self.database
+        kpo, index = self.expiry_indexes.get(dbo.dbase, (None, None))
+        if index is None or kpo is not dbo.kpo:
+            index = ExpiryIndex(dbo.kpo.entries)
+            self.expiry_indexes[dbo.dbase] = (dbo.kpo, index)
+        return index
+
+    def _get_cached_index(self, dbo):
+        """Return the search index for a database wrapped in the result cache
+
+        """
+        index = self._get_index(dbo)
+        return CachedIndex(index, self.result_cache, dbo.dbase,
+                           self.generations[dbo.dbase])
+
+    def _bump_generation(self, dbase):
+        """Invalidate cached search results of a database after it was edited,
+        saved or reloaded
+
+        """
+        self.generations[dbase] = self.generations.get(dbase, 0) + 1
+        self.usage.changed(dbase)
+
+    def _database_changed(self, dbo):
+        """Drop every index and the resolved references of a database after a
+        change that can affect any number of entries
+
+        """
+        for cache in (self.indexes, self.url_indexes, self.expiry_indexes,
+                      self.window_indexes):
+            cache.pop(dbo.dbase, None)
+        deref.CACHES.pop(dbo.kpo, None)
+        self._bump_generation(dbo.dbase)
+
+    def _entry_changed(self, entry, deleted=False, dbo=None):
+        """Update the resolved references and the search index of a database,
+        by default the current one, after an entry was added, edited or
+        deleted. Entries referencing the changed entry are re-indexed too.
+
+        """
+        dbo = dbo or self.database
+        self._bump_generation(dbo.dbase)
+        expiry = self._get_expiry_index(dbo)
+        if deleted:
+            expiry.remove(entry)
+        else:
+            expiry.update(entry)
+        referrers = invalidate_refs(entry) - {entry.uuid}
+        for indexes in (self.indexes, self.url_indexes):
+            kpo, index = indexes.get(dbo.dbase, (None, None))
+            if index is None or kpo is not dbo.kpo:
+                continue
+            if deleted:
+                index.remove(entry)
+            else:
+                index.update(entry)
+            for key in referrers:
+                # Referrers without a usable URL are not in the URL index yet
+                referrer = index.entries.get(key) or \
+                    dbo.kpo.find_entries(uuid=key, first=True)
+                if referrer is not None:
+                    index.update(referrer)
+
+    def _check_config(self, force=False, reprobe=False):
+        """Reload config.ini if it changed since it was last read. Open
+        databases stay unlocked. A broken config is reported and the previous
+        settings are kept.
+
+        Args: force - bool, reload even if the file didn't change
+              reprobe - bool, probe the clipboard and typing tools again
+
+        """
+        if not self.config_watcher.changed() and not force:
+            return
+        names = ("CONF", "SETTINGS", "CACHE_PERIOD_MIN", "MAX_LEN", "SEQUENCE")
+        previous = {i: getattr(keepmenu, i) for i in names}
+        try:
+            keepmenu.reload_config(self.conf_file, reprobe=reprobe)
+        except (SystemExit, Exception) as err:  # pylint: disable=broad-except
+            for name, value in previous.items():
+                setattr(keepmenu, name, value)
+            if not isinstance(err, SystemExit):
+                dmenu_err(f"Config file error: {err}")
+            return
+        if keepmenu.CACHE_PERIOD_MIN != previous["CACHE_PERIOD_MIN"] and \
+                hasattr(self, 'cache_timer'):
+            self.cache_timer.cancel()
+            self._set_timer()
+        self._update_server_db_state()
+
+    def _record_use(self, entry):
+        """Record a selected entry for frecency ordering
+
+        """
+        if keepmenu.SETTINGS.frecency:
+            frecency.STORE.record(self._database_of(entry).dbase, entry)
+
+    def _menu_databases(self):
+        """Return the databases listed in the menus: with 'merge_databases'
+        every unlocked database, the current one first, otherwise only the
+        current database
+
+        """
+        if not keepmenu.SETTINGS.merge_databases:
+            return [self.database]
+        return [self.database] + [i for i in self.open_databases.values()
+                                  if i.kpo is not None and i.dbase != self.database.dbase]
+
+    def _database_of(self, entry):
+        """Return the open database an entry belongs to
+
+        """
+        kpo = entry._kp  # pylint: disable=protected-access
+        if kpo is self.database.kpo:
+            return self.database
+        return next((i for i in self.open_databases.values() if i.kpo is kpo), self.database)
+
+    def _sources(self):
+        """Return {PyKeePass object: database path} to tag menu lines with
+        their database, or None if only one database is listed
+
+        """
+        dbs = self._menu_databases()
+        return {i.kpo: i.dbase for i in dbs} if len(dbs) > 1 else None
+
+    def _update_cache_stats(self):
+        """Publish result cache counters and the memory use of each database
+        for `keepmenu --stats`
+
+        """
+        if self.shared_state is not None:
+            self.shared_state.cache_stats = self.result_cache.stats()
+            self.shared_state.db_stats = self.usage.stats(list(self.open_databases.values()))
+
+    def _evict(self):
+        """Lock the databases unused for 'db_idle_min' minutes, then the least
+        recently used ones until the others fit in 'memory_budget_mb'. The
+        current database is never locked. Locked databases stay in
+        open_databases with their password, keyfile and autotype so they are
+        reopened without prompts.
+
+        """
+        settings = keepmenu.SETTINGS
+        victims = self.usage.victims(list(self.open_databases.values()), self.database.dbase,
+                                     idle=settings.db_idle_min * 60,
+                                     budget=settings.memory_budget_mb * 2**20)
+        for dbo in victims:
+            if self.prev_entry is not None and \
+                    self.prev_entry._kp is dbo.kpo:  # pylint: disable=protected-access
+                self.prev_entry = None
+            dbo.kpo = None
+            for cache in (self.indexes, self.url_indexes, self.expiry_indexes,
+                          self.window_indexes):
+                cache.pop(dbo.dbase, None)
+            self.usage.forget(dbo.dbase)
+        if victims:
+            self._update_server_db_state()
+            self._update_cache_stats()
+
+    def _start_preunlock(self):
+        """Unlock the databases that have a password or password_cmd in the
+        config in background threads, if 'preunlock' is set. Must be called
+        in the daemon process, after the fork.
+
+        The key derivation (argon2-cffi, pycryptodome) releases the GIL, so
+        the databases are unlocked in parallel. Threads are used instead of
+        processes because the unlocked PyKeePass objects can't be pickled.
+
+        """
+        if not keepmenu.SETTINGS.preunlock or self.unlock_pool is not None:
+            return
+        self.unlock_pool = ThreadPoolExecutor(max_workers=os.cpu_count() or 1,
+                                              thread_name_prefix="keepmenu-unlock")
+        self.unlock_pool.submit(self._preunlock)
+
+    def _preunlock(self):
+        """Queue an unlock of every config-passwordable database that isn't
+        open yet
+
+        """
+        def done(future):
+            if future.result() is not None:
+                self.unlocked.put(future.result())
+
+        opened = set(self.open_databases)
+        dbs = [i for i in get_databases(resolve=False)
+               if i.dbase not in opened and isfile(i.dbase)]
+        resolve_passwords(dbs, quiet=True)
+        for dbo in dbs:
+            if dbo.pword is not None:
+                self.unlock_pool.submit(unlock_database, dbo).add_done_callback(done)
+
+    def _publish_unlocked(self):
+        """Add the databases unlocked in the background to open_databases.
+        Runs in the menu thread so open_databases is never changed while a
+        menu uses it.
+
+        """
+        changed = False
+        while True:
+            try:
+                dbo = self.unlocked.get_nowait()
+            except Empty:
+                break
+            current = self.open_databases.get(dbo.dbase)
+            if current is None or current.kpo is None:
+                self.open_databases[dbo.dbase] = dbo
+                self.usage.touch(dbo)
+                changed = True
+        if changed:
+            self._update_server_db_state()
+
     def _update_server_db_state(self):
-        # publish open DBs (only those with valid kpo)
+        # publish open DBs: those with a valid kpo, and those locked by
+        # _evict that the daemon reopens with their kept password
         if self.shared_state is not None:
-            valid_open_dbs = [path for path, db in self.open_databases.items() if db.kpo is not None]
+            valid_open_dbs = [path for path, db in self.open_databases.items()
+                              if db.kpo is not None or db.pword is not None]
             self.shared_state.open_database_paths = valid_open_dbs
         # publish which DBs have a password or password_cmd in config
         paths = set()
@@ -367,23 +702,32 @@ class DmenuRunner(Process):
     def run(self):
         # Update server state after fork to ensure shared state is properly initialized
         self._update_server_db_state()
+        self._start_preunlock()
         try:
             while True:
-                self.server.start_flag.wait()
+                while not self.server.start_flag.wait(
+                        EVICT_CHECK_SEC if keepmenu.SETTINGS.db_idle_min else None):
+                    self._evict()
                 if self.server.kill_flag.is_set():
                     break
+                self._check_config()
+                self._publish_unlocked()
                 if not self.database or not self.database.kpo:
                     pass
                 elif self.server.args_flag.is_set():
-                    dargs = self.server.get_args()
-                    keepmenu.CLIPBOARD = dargs.get('clipboard', False) or keepmenu.CLIPBOARD
-                    self.menu_open_another_database(**dargs)
+                    self._run_args(self.server.get_args())
                     self.server.args_flag.clear()
                     if self.server.totp_flag.is_set():
                         self.server.totp_flag.clear()
                 else:
                     self.dmenu_run(self.server.totp_flag.is_set())
                     self.server.totp_flag.clear()
+                # --group/--query only apply to the invocation that passed them
+                self.scope = ((), "")
+                if self.database and self.database.kpo:
+                    for dbo in self._menu_databases():
+                        self.usage.touch(dbo)
+                self._evict()
                 if self.server.cache_time_expired.is_set():
                     self.server.kill_flag.set()
                 if self.server.kill_flag.is_set():
@@ -391,6 +735,27 @@ class DmenuRunner(Process):
                 self.server.start_flag.clear()
         except (SystemExit, KeyboardInterrupt):
             self.server.kill_flag.set()
+        finally:
+            if self.unlock_pool is not None:
+                self.unlock_pool.shutdown(wait=False)
+
+    def _run_args(self, dargs):
+        """Run an invocation that passed arguments to the daemon. Arguments
+        that don't select a database (--group, --query, --reprobe,
+        --clipboard) show the menu of the current database without asking
+        which database to use.
+
+        Args: dargs - dict of the command line arguments
+
+        """
+        self.scope = self._get_scope(dargs)
+        if dargs.pop('reprobe', False):
+            self._check_config(force=True, reprobe=True)
+        keepmenu.CLIPBOARD = dargs.get('clipboard', False) or keepmenu.CLIPBOARD
+        if any(v for k, v in dargs.items() if k != 'clipboard'):
+            self.menu_open_another_database(**dargs)
+        else:
+            self.dmenu_run(self.server.totp_flag.is_set())
 
     def cache_time(self):
         """Kill keepmenu daemon when cache timer expires
@@ -416,18 +781,13 @@ class DmenuRunner(Process):
         except AttributeError:
             pass
         self._set_timer()
-        if keepmenu.CONF.has_option("database", "hide_groups"):
-            hid_groups = keepmenu.CONF.get("database", "hide_groups").split("\n")
+        hid_groups = keepmenu.SETTINGS.hide_groups
+        if hid_groups:
             # Validate ignored group names in config.ini
-            hid_groups = [i for i in hid_groups if i in
-                          [j.name for j in self.database.kpo.groups]]
-        else:
-            hid_groups = []
+            group_names = {j.name for j in self.database.kpo.groups}
+            hid_groups = [i for i in hid_groups if i in group_names]
 
-        filtered_entries = [
-            i for i in self.database.kpo.entries if not
-            any(j in "/".join(i.path[:-1]) for j in hid_groups)
-        ]
+        filtered_entries = self._visible_entries(hid_groups)
         clip = "[Clipboard]/Type" if keepmenu.CLIPBOARD is True else "Clipboard/[Type]"
         options = {
             'View/Type Individual entries':
@@ -435,7 +795,9 @@ class DmenuRunner(Process):
             'View previous entry': self.menu_view_previous_entry,
             f'Edit expiring/expired passwords ({len(self.expiring)})':
                 functools.partial(self.menu_edit_entries, self.expiring),
-            'Edit entries': functools.partial(self.menu_edit_entries, self.database.kpo.entries),
+            'Edit entries': functools.partial(self.menu_edit_entries,
+                                              [j for i in self._menu_databases()
+                                               for j in i.kpo.entries]),
             'Add entry': self.menu_add_entry,
             'Manage groups': self.menu_manage_groups,
             'Reload database': self.menu_reload_database,
@@ -448,42 +810,90 @@ class DmenuRunner(Process):
         if len(self.expiring) == 0:
             del options['Edit expiring/expired passwords (0)']
 
+        matches, associated = [], []
+        if keepmenu.SETTINGS.window_match and not totp_mode:
+            matches, associated = self._window_matches(filtered_entries)
         if totp_mode:
             sel = self.menu_view_type_individual_entries(hid_groups, totp_only=True)
+        elif len(associated) == 1:
+            # Exactly one entry has an auto-type association with the focused
+            # window: type it. Title and URL matches can be accidental, so
+            # they are only listed first.
+            sel = associated[0]
         else:
-            sel = view_all_entries(list(options), filtered_entries, self.database.dbase)
+            sel = view_all_entries(list(options), filtered_entries, self.database.dbase,
+                                   top=matches, sources=self._sources())
 
         if not sel:
             return
-        if sel in options:
-            func = options[sel]
-            func()
-        else:
-            try:
-                entry = filtered_entries[int(sel.split('-', 1)[0])]
-            except (ValueError, TypeError):
+        if isinstance(sel, str):
+            if sel not in options:
                 return
-            type_entry(entry, self.database.atype)
+            options[sel]()
+        else:
+            entry = sel
+            self._record_use(entry)
+            dbo = self._database_of(entry)
+            type_entry(entry, self.database.atype if dbo is self.database else dbo.atype)
             self.prev_entry = entry
         # Reset database autotype and totp in between runs
         cur_db = [i for i in self.open_databases.values() if i.is_active is True][0]
         self.database.atype = cur_db.atype
         self.database.totp = cur_db.totp
 
+    def _window_matches(self, entries):
+        """Return the entries matching the focused window, from the window
+        index of each listed database. It is rebuilt after the database
+        changed.
+
+        Args: entries - list of the entries that may be returned
+        Returns: (list of all matching entries, list of the entries with an
+                  auto-type association matching the window)
+
+        """
+        title = active_title(keepmenu.SETTINGS.window_provider)
+        if not title:
+            return [], []
+        res = []
+        associated = []
+        for dbo in self._menu_databases():
+            generation = self.generations.get(dbo.dbase, 0)
+            kpo, gen, index = self.window_indexes.get(dbo.dbase, (None, None, None))
+            if index is None or kpo is not dbo.kpo or gen != generation:
+                index = WindowIndex(dbo.kpo.entries)
+                self.window_indexes[dbo.dbase] = (dbo.kpo, generation, index)
+            res.extend(index.match(title))
+            associated.extend(index.associated(title))
+        visible = {(i._kp, i.uuid) for i in entries}  # pylint: disable=protected-access
+        return ([i for i in res if (i._kp, i.uuid) in visible],  # pylint: disable=protected-access
+                [i for i in associated if (i._kp, i.uuid) in visible])  # pylint: disable=protected-access
+
+    def _visible_entries(self, hid_groups):
+        """Return the entries of the listed databases outside the hidden
+        groups, limited to the --group/--query scope of this invocation
+
+        """
+        entries = []
+        for dbo in self._menu_databases():
+            if any(self.scope):
+                entries.extend(self._get_cached_index(dbo).scope(*self.scope))
+            else:
+                entries.extend(dbo.kpo.entries)
+        return [i for i in entries if not
+                any(j in "/".join(i.path[:-1]) for j in hid_groups)]
+
     def menu_view_type_individual_entries(self, hid_groups, totp_only=False):
         """Process menu entry - View/Type individual entries
 
         """
         options = []
-        filtered_entries = [
-            i for i in self.database.kpo.entries if not
-            any(j in "/".join(i.path[:-1]) for j in hid_groups) and (get_otp_url(i) if totp_only else True)
-        ]
-        sel = view_all_entries(options, filtered_entries, self.database.dbase)
-        try:
-            entry = filtered_entries[int(sel.split('-', 1)[0])]
-        except (ValueError, TypeError):
+        filtered_entries = [i for i in self._visible_entries(hid_groups)
+                            if (get_otp_url(i) if totp_only else True)]
+        entry = view_all_entries(options, filtered_entries, self.database.dbase,
+                                 sources=self._sources())
+        if entry is None:
             return
+        self._record_use(entry)
         text = gen_otp(get_otp_url(entry)) if totp_only else view_entry(entry)
         type_text(text)
         self.prev_entry = entry
@@ -501,16 +911,17 @@ class DmenuRunner(Process):
 
         """
         options = []
-        sel = view_all_entries(options, entries, self.database.dbase)
-        try:
-            entry = entries[int(sel.split('-', 1)[0])]
-        except (ValueError, TypeError):
+        entry = view_all_entries(options, entries, self.database.dbase,
+                                 sources=self._sources())
+        if entry is None:
             return
+        dbo = self._database_of(entry)
         edit = True
-        while edit is True:
-            edit = edit_entry(self.database.kpo, entry)
-        self.database.kpo.save()
-        self.expiring = get_expiring_entries(self.database.kpo.entries)
+        with launcher_session():
+            while edit is True:
+                edit = edit_entry(dbo.kpo, entry)
+        dbo.kpo.save()
+        self._entry_changed(entry, deleted=edit == "del", dbo=dbo)
         self.prev_entry = entry if edit != "del" else None
 
     def menu_add_entry(self):
@@ -520,6 +931,7 @@ class DmenuRunner(Process):
         entry = add_entry(self.database.kpo)
         if entry:
             self.database.kpo.save()
+            self._entry_changed(entry)
             self.prev_entry = entry
 
 
@@ -530,6 +942,8 @@ class DmenuRunner(Process):
         group = manage_groups(self.database.kpo)
         if group:
             self.database.kpo.save()
+            # Group changes can move or delete any number of entries
+            self._database_changed(self.database)
 
     def menu_reload_database(self):
         """Process menu entry - Reload database
@@ -538,7 +952,7 @@ class DmenuRunner(Process):
         self.database.kpo = get_entries(self.database)
         if not self.database.kpo:
             return
-        self.expiring = get_expiring_entries(self.database.kpo.entries)
+        self.open_databases[self.database.dbase].kpo = self.database.kpo
         self.dmenu_run()
 
     def menu_open_another_database(self, **kwargs):
@@ -547,9 +961,10 @@ class DmenuRunner(Process):
         Args: kwargs - possibly 'database', 'keyfile', 'autotype', 'totp'
 
         """
-        if kwargs.get("show"):
+        if kwargs.get("show") or kwargs.get("show_batch") or kwargs.get("url"):
             self.show_password(**kwargs)
             return
+        self._publish_unlocked()
         prev_db = copy(self.database)
         self.database, self.open_databases = get_database(self.open_databases, **kwargs)
         if self.database is None or self.database.kpo is None:
@@ -558,7 +973,6 @@ class DmenuRunner(Process):
             if self.database.dbase in self.open_databases:
                 self.open_databases[self.database.dbase].is_active = True
             return
-        self.expiring = get_expiring_entries(self.database.kpo.entries)
         if self.shared_state is not None:
             self.shared_state.current_database_path = self.database.dbase
         self._update_server_db_state()
@@ -583,7 +997,7 @@ class DmenuRunner(Process):
     def show_password(self, **kwargs):
         """Handle show password requests from CLI
 
-        Args: kwargs - possibly 'database', 'keyfile', 'show', etc.
+        Args: kwargs - possibly 'database', 'keyfile', 'show', 'show_batch', etc.
         """
         from keepmenu.run_once import run_once
         rbase = kwargs.get("database", "")
@@ -593,7 +1007,15 @@ class DmenuRunner(Process):
             kwargs_copy = kwargs.copy()
             kwargs_copy['clipboard'] = False
             kwargs_copy['return_errors'] = True
+            dbs = self._menu_databases()
+            kwargs_copy['index'] = self._get_cached_index(self.database)
+            kwargs_copy['url_index'] = self._get_url_index(self.database)
+            if len(dbs) > 1:
+                kwargs_copy['index'] = MergedIndex([self._get_cached_index(i) for i in dbs])
+                kwargs_copy['url_index'] = MergedIndex([self._get_url_index(i) for i in dbs])
+                kwargs_copy['sources'] = self._sources()
             result = run_once(db=self.database, **kwargs_copy)
+            self._update_cache_stats()
             self.server._parent_conn.send(result or "")
             return
 
@@ -607,6 +1029,11 @@ class DmenuRunner(Process):
                 target_db = db
                 break
 
+        # Databases locked by _evict keep their password: unlock them again
+        if target_db is not None and target_db.kpo is None and target_db.pword is not None:
+            target_db.kpo = get_entries(target_db, cli_mode=True)
+            self._update_server_db_state()
+
         # If found but failed to open previously (kpo is None), remove it and retry
         if target_db is not None and target_db.kpo is None:
             del self.open_databases[requested_db_path]
@@ -636,7 +1063,11 @@ class DmenuRunner(Process):
             kwargs_copy = kwargs.copy()
             kwargs_copy['clipboard'] = False
             kwargs_copy['return_errors'] = True
+            kwargs_copy['index'] = self._get_cached_index(target_db)
+            kwargs_copy['url_index'] = self._get_url_index(target_db)
+            self.usage.touch(target_db)
             result = run_once(db=target_db, **kwargs_copy)
+            self._update_cache_stats()
             self.server._parent_conn.send(result or "")
         else:
             error_msg = f"ERROR: Database {rbase} is not open and password is not available in config."
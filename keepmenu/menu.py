@@ -1,91 +1,177 @@
 """Launcher functions
 
 """
+from contextlib import contextmanager
+from dataclasses import dataclass
+from itertools import islice
+import json
 from os.path import basename
 import shlex
 import sys
-from subprocess import run
+from subprocess import CompletedProcess, PIPE, Popen, run, TimeoutExpired
+from threading import Thread
 
 import keepmenu
 
 
-def dmenu_cmd(num_lines, prompt):
-    """Parse config.ini for dmenu options
+# Arguments added for each launcher. {prompt}, {lines} and {lines1}
+# (num_lines + 1) are filled in for each menu.
+LAUNCHER_ARGS = {"bemenu": ("-p", "{prompt}", "-l", "{lines}"),
+                 "dmenu": ("-p", "{prompt}", "-l", "{lines}"),
+                 "wmenu": ("-p", "{prompt}", "-l", "{lines}"),
+                 "rofi": ("-dmenu", "-p", "{prompt}", "-l", "{lines}"),
+                 "tofi": ("--require-match=false",
+                          "--prompt-text={prompt}: ",
+                          "--num-results={lines}"),
+                 "wofi": ("--dmenu", "-p", "{prompt}", "-L", "{lines1}"),
+                 "yofi": ("-p", "{prompt}", "dialog"),
+                 "fuzzel": ("-p", "{prompt} ", "-l", "{lines}")}
+PASSWORD_ARGS = {"rofi": ('-password',),
+                 "bemenu": ('-x', 'indicator', '*'),
+                 "tofi": ("--hide-input=true", "--hidden-character=*"),
+                 "wofi": ('-P',),
+                 "yofi": ('--password',),
+                 "fuzzel": ('--password',)}
+# Arguments making the launcher print the index of the selected line instead
+# of its text
+INDEX_ARGS = {"rofi": ("-format", "i"),
+              "fuzzel": ("--index",)}
+# Lines per write when streaming menu input
+STREAM_CHUNK_LINES = 256
+PASSWORD_PROMPTS = ("Password", "password", "client_secret", "Verify password", "Enter Password")
+
+
+@dataclass(frozen=True)
+class LauncherProfile:
+    """Launcher command line options, parsed once per config load
+
+        argv - tuple, base command from 'dmenu_command'
+        templates - tuple, per-launcher argument templates (see LAUNCHER_ARGS)
+        password_args - tuple, arguments added to password prompts. Empty if
+                        'obscure' is disabled.
+        index_args - tuple, arguments to output the selected line's index.
+                     Empty if the launcher can't or dmenu_command already sets
+                     an output format.
+        session_argv - tuple, long running wrapper from 'session_command'
+                       that shows the menus of a LauncherSession. Empty if
+                       not set.
+
+    """
+    argv: tuple = ("dmenu",)
+    templates: tuple = ()
+    password_args: tuple = ()
+    index_args: tuple = ()
+    session_argv: tuple = ()
+
+    @classmethod
+    def from_config(cls, conf):
+        """Build the profile from a ConfigParser
+
+        Args: conf - ConfigParser
+        Returns: LauncherProfile
+
+        """
+        argv = tuple(shlex.split(conf.get('dmenu', 'dmenu_command', fallback='dmenu')))
+        name = basename(argv[0])
+        password_args = ()
+        if conf.getboolean('dmenu_passphrase', 'obscure', fallback=True) is True:
+            if name in ('dmenu', 'wmenu'):
+                password_args = tuple(dmenu_pass(name, conf))
+            else:
+                password_args = PASSWORD_ARGS.get(name, ())
+        index_args = INDEX_ARGS.get(name, ())
+        if any(i in argv for i in ("-format", "--index")):
+            index_args = ()
+        session_argv = tuple(shlex.split(conf.get('dmenu', 'session_command', fallback='')))
+        return cls(argv, LAUNCHER_ARGS.get(name, ()), password_args, index_args,
+                   session_argv)
+
+    def command(self, num_lines, prompt, index=False):
+        """Return the launcher invocation for one menu
+
+        Args: num_lines - number of lines to display
+              prompt - prompt to show
+              index - bool, output the index of the selected line
+        Returns: list of strings
+
+        """
+        command = list(self.argv)
+        command.extend(i.format(prompt=prompt, lines=num_lines, lines1=num_lines + 1)
+                       for i in self.templates)
+        if prompt in PASSWORD_PROMPTS:
+            command.extend(self.password_args)
+        if index:
+            command.extend(self.index_args)
+        return command
+
+
+def dmenu_cmd(num_lines, prompt, index=False):
+    """Build the launcher command from the launcher profile in the current
+    settings
 
     Args: args - num_lines: number of lines to display
                  prompt: prompt to show
+                 index: output the index of the selected line, if supported
     Returns: command invocation (as a list of strings) for
                 ["dmenu", "-l", "<num_lines>", "-p", "<prompt>", "-i", ...]
 
     """
-    commands = {"bemenu": ["-p", str(prompt), "-l", str(num_lines)],
-                "dmenu": ["-p", str(prompt), "-l", str(num_lines)],
-                "wmenu": ["-p", str(prompt), "-l", str(num_lines)],
-                "rofi": ["-dmenu", "-p", str(prompt), "-l", str(num_lines)],
-                "tofi": ["--require-match=false",
-                         f"--prompt-text={str(prompt)}: ",
-                         f"--num-results={str(num_lines)}"],
-                "wofi": ["--dmenu", "-p", str(prompt), "-L", str(num_lines + 1)],
-                "yofi": ["-p", str(prompt), "dialog"],
-                "fuzzel": ["-p", str(prompt) + " ", "-l", str(num_lines)]}
-    command = shlex.split(keepmenu.CONF.get('dmenu', 'dmenu_command', fallback='dmenu'))
-    command.extend(commands.get(basename(command[0]), []))
-    pwprompts = ("Password", "password", "client_secret", "Verify password", "Enter Password")
-    obscure = keepmenu.CONF.getboolean('dmenu_passphrase', 'obscure', fallback=True)
-    if any(i == prompt for i in pwprompts) and obscure is True:
-        pass_prompts = {"dmenu": dmenu_pass(basename(command[0])),
-                        "wmenu": dmenu_pass(basename(command[0])),
-                        "rofi": ['-password'],
-                        "bemenu": ['-x', 'indicator', '*'],
-                        "tofi": ["--hide-input=true", "--hidden-character=*"],
-                        "wofi": ['-P'],
-                        "yofi": ['--password'],
-                        "fuzzel": ['--password']}
-        command.extend(pass_prompts.get(basename(command[0]), []))
-    return command
-
-
-def dmenu_pass(command):
+    return keepmenu.SETTINGS.launcher.command(num_lines, str(prompt), index)
+
+
+def dmenu_pass(command, conf=None):
     """Check if dmenu passphrase patch is applied and return the correct command
-    line arg list for wmenu or dmenu
+    line arg list for wmenu or dmenu. The check result is cached with the other
+    capability probes.
 
     Args: command - string
+          conf - ConfigParser, defaults to keepmenu.CONF
     Returns: list or None
 
     """
     if command not in ('dmenu', 'wmenu'):
         return None
-    try:
-        # Check for dmenu password patch
-        dm_patch = b'P' in run([command, "-h"],
-                               capture_output=True,
-                               check=False).stderr
-    except FileNotFoundError:
-        dm_patch = False
-    color = keepmenu.CONF.get('dmenu_passphrase', 'obscure_color', fallback="#222222")
+    conf = keepmenu.CONF if conf is None else conf
+    # Check for dmenu password patch
+    dm_patch = keepmenu.probe([command, "-h"], check=lambda res: b'P' in res.stderr)
+    color = conf.get('dmenu_passphrase', 'obscure_color', fallback="#222222")
     dargs = { "dmenu":  ["-nb", color, "-nf", color],
               "wmenu":  ["-n", color, "-N", color] }
     return ["-P"] if dm_patch else dargs[command]
 
 
-def dmenu_select(num_lines, prompt="Entries", inp=""):
+def dmenu_select(num_lines, prompt="Entries", inp="", index=False):
     """Call dmenu and return the selected entry
 
     Args: num_lines - number of lines to display
           prompt - prompt to show
-          inp - bytes string to pass to dmenu via STDIN
+          inp - string to pass to dmenu via STDIN, or an iterable of lines
+                (without newlines) which is streamed to dmenu in chunks
+          index - bool, return the index of the selected line if the
+                  launcher supports it (see LauncherProfile.index_args)
 
     Returns: sel - string
 
     """
-    cmd = dmenu_cmd(num_lines, prompt)
+    cmd = dmenu_cmd(num_lines, prompt, index)
+    if SESSION is not None and not SESSION.failed:
+        if not isinstance(inp, str):
+            # Joined once so the fallback below still has the lines
+            inp = "\n".join(inp)
+        res = SESSION.select(cmd, str(prompt), num_lines, inp,
+                             index and bool(keepmenu.SETTINGS.launcher.index_args))
+        if res is not None:
+            return res
     try:
-        res = run(cmd,
-                  capture_output=True,
-                  check=False,
-                  encoding=keepmenu.ENC,
-                  env=keepmenu.ENV,
-                  input=inp)
+        if isinstance(inp, str):
+            res = run(cmd,
+                      capture_output=True,
+                      check=False,
+                      encoding=keepmenu.ENC,
+                      env=keepmenu.ENV,
+                      input=inp)
+        else:
+            res = stream_to_launcher(cmd, inp)
     except FileNotFoundError:
         print(f"dmenu command not found: {cmd[0]}", file=sys.stderr)
         sys.exit(1)
@@ -97,6 +183,163 @@ def dmenu_select(num_lines, prompt="Entries", inp=""):
     return res.stdout.rstrip('\n') if res.stdout is not None else None
 
 
+def stream_to_launcher(cmd, lines, chunk_size=STREAM_CHUNK_LINES):
+    """Run the launcher, writing lines to its stdin in chunks as they are
+    generated so launchers that read incrementally can draw the first page
+    before the whole list is formatted.
+
+    Args: cmd - launcher command (list)
+          lines - iterable of strings, one per menu line
+          chunk_size - number of lines per write
+    Returns: CompletedProcess
+
+    """
+    with Popen(cmd, stdin=PIPE, stdout=PIPE, stderr=PIPE,
+               encoding=keepmenu.ENC, env=keepmenu.ENV) as proc:
+        # Drain stderr so a chatty launcher can't block while we write
+        stderr = []
+        drain = Thread(target=lambda: stderr.append(proc.stderr.read()), daemon=True)
+        drain.start()
+        try:
+            for chunk in batched(lines, chunk_size):
+                proc.stdin.write("\n".join(chunk) + "\n")
+                proc.stdin.flush()
+        except BrokenPipeError:
+            # The launcher exited before reading everything
+            pass
+        try:
+            proc.stdin.close()
+        except BrokenPipeError:
+            pass
+        stdout = proc.stdout.read()
+        proc.wait()
+        drain.join()
+    return CompletedProcess(cmd, proc.returncode, stdout, "".join(stderr))
+
+
+class LauncherSession:
+    """One long running launcher process shared by the menus of a multi-step
+    flow, e.g. editing an entry
+
+    The 'session_command' wrapper is started on the first menu and kept alive
+    until the flow ends. Each menu is sent as one JSON line on its stdin:
+
+        {"command": [one-shot launcher command], "prompt": str, "lines": int,
+         "password": bool, "index": bool, "input": str}
+
+    and the wrapper answers with one JSON line {"selection": str or null},
+    where the selection is the 0-based line number if "index" is set. If
+    the wrapper can't be started or stops answering, the remaining menus fall
+    back to spawning the launcher once per menu.
+
+    Args: argv - wrapper command (tuple)
+
+    """
+    def __init__(self, argv):
+        self.argv = argv
+        self.proc = None
+        self.failed = not argv
+
+    def _start(self):
+        try:
+            self.proc = Popen(self.argv, stdin=PIPE, stdout=PIPE,
+                              encoding=keepmenu.ENC, env=keepmenu.ENV)
+        except OSError as err:
+            print(f"Launcher session command failed: {err}", file=sys.stderr)
+            self.failed = True
+
+    def select(self, cmd, prompt, num_lines, inp, index=False):
+        """Show one menu in the session process
+
+        Args: cmd - one-shot launcher command (list)
+              prompt - prompt to show
+              num_lines - number of lines to display
+              inp - string
+              index - bool, ask for the line number of the selection
+        Returns: selected string, "" if the menu was cancelled, or None if
+                 the session is unavailable and the caller should spawn the
+                 launcher itself
+
+        """
+        if self.failed:
+            return None
+        if self.proc is None:
+            self._start()
+            if self.failed:
+                return None
+        request = {"command": cmd,
+                   "prompt": prompt,
+                   "lines": num_lines,
+                   "password": prompt in PASSWORD_PROMPTS,
+                   "index": index,
+                   "input": inp}
+        try:
+            self.proc.stdin.write(json.dumps(request) + "\n")
+            self.proc.stdin.flush()
+            response = json.loads(self.proc.stdout.readline())
+            sel = response["selection"]
+        except (OSError, ValueError, KeyError, TypeError):
+            print("Launcher session stopped responding. Falling back to "
+                  f"{cmd[0]}.", file=sys.stderr)
+            self.close()
+            self.failed = True
+            return None
+        return "" if sel is None else str(sel).rstrip('\n')
+
+    def close(self):
+        """Stop the session process
+
+        """
+        if self.proc is None:
+            return
+        try:
+            self.proc.stdin.close()
+        except OSError:
+            pass
+        try:
+            self.proc.wait(timeout=1)
+        except TimeoutExpired:
+            self.proc.kill()
+            self.proc.wait()
+        self.proc.stdout.close()
+        self.proc = None
+
+
+# Session used by dmenu_select, set by launcher_session()
+SESSION = None
+
+
+@contextmanager
+def launcher_session():
+    """Share one launcher process between the menus shown inside the with
+    block, if 'session_command' is configured. Nested blocks reuse the outer
+    session.
+
+    """
+    global SESSION  # pylint: disable=global-statement
+    if SESSION is not None:
+        yield SESSION
+        return
+    SESSION = LauncherSession(keepmenu.SETTINGS.launcher.session_argv)
+    try:
+        yield SESSION
+    finally:
+        SESSION.close()
+        SESSION = None
+
+
+def batched(iterable, size):
+    """Yield lists of up to size items from iterable
+
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
 def dmenu_err(prompt):
     """Pops up a dmenu prompt with an error message
 
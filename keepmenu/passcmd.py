@@ -0,0 +1,84 @@
+"""Run password_cmd_n commands, concurrently, caching their output
+
+The daemon keeps each successful result in memory for a TTL so opening a
+database or running --show -d doesn't run pass/gpg/secret-tool every time.
+
+"""
+from concurrent.futures import ThreadPoolExecutor
+import shlex
+import subprocess
+from threading import Lock
+import time
+
+import keepmenu
+
+
+def run_command(cmd):
+    """Run one password command
+
+    Args: cmd - command string
+    Returns: (stdout without the trailing newline, stderr)
+
+    """
+    try:
+        res = subprocess.run(shlex.split(cmd), capture_output=True, check=False,
+                             encoding=keepmenu.ENC)
+    except (OSError, ValueError) as err:
+        return "", str(err)
+    return res.stdout.rstrip('\n'), res.stderr
+
+
+class PasswordCommands:
+    """Password command results cached for a number of seconds
+
+        results - dict {command: (time of the run, stdout)}
+
+    """
+    def __init__(self):
+        self.results = {}
+        self.lock = Lock()
+
+    def run(self, cmds, ttl=0):
+        """Run commands, concurrently when there are several, reusing
+        results younger than ttl. Commands that printed to stderr are not
+        cached.
+
+        Args: cmds - list of command strings
+              ttl - seconds to keep a result. 0 disables the cache.
+        Returns: dict {command: (stdout, stderr)}
+
+        """
+        now = time.monotonic()
+        res = {}
+        with self.lock:
+            for cmd in cmds:
+                if cmd in self.results and now - self.results[cmd][0] < ttl:
+                    res[cmd] = (self.results[cmd][1], "")
+        todo = [i for i in dict.fromkeys(cmds) if i not in res]
+        if len(todo) > 1:
+            with ThreadPoolExecutor(max_workers=len(todo)) as pool:
+                out = list(pool.map(run_command, todo))
+        else:
+            out = [run_command(i) for i in todo]
+        with self.lock:
+            for cmd, (stdout, stderr) in zip(todo, out):
+                res[cmd] = (stdout, stderr)
+                if ttl > 0 and not stderr:
+                    self.results[cmd] = (now, stdout)
+        return res
+
+    def forget(self, cmd=None):
+        """Drop one cached result, e.g. after it failed to unlock its
+        database, or all of them
+
+        """
+        with self.lock:
+            if cmd is None:
+                self.results.clear()
+            else:
+                self.results.pop(cmd, None)
+
+
+CACHE = PasswordCommands()
+
+# vim: set et ts=4 sw=4 :
@@ -0,0 +1,606 @@
+"""Search query compilation and entry indexes for --show lookups
+
+Query syntax: whitespace separated terms, all of which must match. Quote
+values containing spaces.
+
+    group:infra user:deploy url:*.corp title:"db prod" uuid:<uuid>
+
+    field:value    value is a substring of the field
+    field:=value   field is exactly value
+    field:value*   field starts with value
+    field:a*b?     glob match (* and ?) against the whole field
+    value          unqualified terms match any of title, username, url, path
+
+Matching is case insensitive. A query without any field qualifier is handled
+exactly like the original bag-of-substrings search.
+
+With full text search enabled, unqualified terms also match whole words in
+the notes and the non-protected custom attributes of an entry, and results
+are ranked so that title hits come before username/url, group and finally
+notes/attribute hits.
+
+"""
+from bisect import bisect_left
+from collections import OrderedDict
+from dataclasses import dataclass
+from fnmatch import fnmatchcase
+from itertools import count
+import re
+import shlex
+from urllib.parse import urlsplit
+
+import keepmenu
+from keepmenu.totp import TOTP_SECRET_FIELDS
+
+QUERY_FIELDS = {"title": "title",
+                "user": "username",
+                "username": "username",
+                "url": "url",
+                "group": "group",
+                "path": "path",
+                "uuid": "uuid"}
+# Fields searched by unqualified terms
+DEFAULT_FIELDS = ("title", "username", "url", "group", "path")
+# Ranking weight of a hit in each field. Full text hits rank lowest.
+FIELD_WEIGHTS = {"title": 8, "username": 4, "url": 4, "group": 2, "path": 2}
+TEXT_WEIGHT = 1
+TOKEN_RE = re.compile(r"\w+")
+RESULT_CACHE_SIZE = 256
+# Second level labels that are public suffixes under two letter country TLDs
+# ('co.uk', 'com.au'), so the registrable domain has three labels
+PUBLIC_SECOND_LEVELS = {"ac", "co", "com", "edu", "gob", "gov", "govt", "ltd", "mil",
+                        "net", "nhs", "nic", "or", "org", "plc", "sch"}
+
+
+@dataclass(frozen=True)
+class Term:
+    """A single compiled query term
+
+        field - string, indexed field name or None for any field
+        op - string, one of 'contains', 'exact', 'prefix', 'glob'
+        value - string, lower case value to match
+
+    """
+    field: str = None
+    op: str = "contains"
+    value: str = ""
+
+    def match(self, value):
+        """Test a (lower case) field value against this term
+
+        """
+        if self.op == "exact":
+            return value == self.value
+        if self.op == "prefix":
+            return value.startswith(self.value)
+        if self.op == "glob":
+            return fnmatchcase(value, self.value)
+        return self.value in value
+
+
+def normalize_uuid(value):
+    """Return a uuid string without dashes or braces, lower case
+
+    """
+    return value.strip("{}").replace("-", "").lower()
+
+
+def tokenize(text):
+    """Split text into a set of lower case words
+
+    """
+    return set(TOKEN_RE.findall(text.lower()))
+
+
+def protected_keys(entry):
+    """Return the names of the protected string fields of an entry, read from
+    the Protected flag of their XML values (pykeepass < 4.1 has no accessor)
+
+    """
+    return {i.findtext('Key') for i in entry._element.findall('String')  # pylint: disable=protected-access
+            if i.find('Value') is not None and i.find('Value').get('Protected') == 'True'}
+
+
+def entry_text(entry):
+    """Return the notes and non-protected, non-OTP custom attribute values of
+    an entry for full text indexing
+
+    """
+    text = [keepmenu.safe_deref(entry, "notes")]
+    protected = protected_keys(entry)
+    for attr, val in entry.custom_properties.items():
+        if attr in TOTP_SECRET_FIELDS or attr in protected or not val:
+            continue
+        text.append(val)
+    return "\n".join(text)
+
+
+def compile_query(search_string):
+    """Compile a search string into a tuple of Terms
+
+    Args: search_string - string
+    Returns: tuple of Term objects. Empty if the search string has no field
+             qualifiers and should be handled as a plain search.
+
+    """
+    try:
+        tokens = shlex.split(search_string)
+    except ValueError:
+        tokens = search_string.split()
+    if not any(i.split(":", 1)[0].lower() in QUERY_FIELDS for i in tokens if ":" in i):
+        return ()
+    terms = []
+    for token in tokens:
+        field = None
+        if ":" in token and token.split(":", 1)[0].lower() in QUERY_FIELDS:
+            field, token = token.split(":", 1)
+            field = QUERY_FIELDS[field.lower()]
+        value = token.lower()
+        if field == "uuid":
+            terms.append(Term(field, "exact", normalize_uuid(value)))
+        elif value.startswith("="):
+            terms.append(Term(field, "exact", value[1:]))
+        elif value.endswith("*") and not any(i in value[:-1] for i in "*?["):
+            terms.append(Term(field, "prefix", value[:-1]))
+        elif any(i in value for i in "*?["):
+            terms.append(Term(field, "glob", value))
+        else:
+            terms.append(Term(field, "contains", value))
+    return tuple(terms)
+
+
+class EntryIndex:
+    """Lower case search fields of a list of entries, precomputed once
+
+    Exact and prefix terms are answered from per-field hash and sorted
+    indexes; the remaining terms only scan the candidates left after that.
+    Entries keep their database order in search results unless full text
+    search is enabled, in which case they are ranked.
+
+    Args: entries - list of KeePass entries
+          fulltext - bool, also index notes and custom attributes. Defaults
+                     to the 'fulltext_search' setting
+
+    """
+    def __init__(self, entries, fulltext=None):
+        if fulltext is None:
+            fulltext = keepmenu.SETTINGS.fulltext_search
+        self.fulltext = fulltext
+        self.entries = {}
+        self.values = {}
+        self._order = {}
+        self._counter = count()
+        self._exact = {i: {} for i in QUERY_FIELDS.values()}
+        self._sorted = {}
+        self._text = {}
+        self._postings = {}
+        for entry in entries:
+            self.add(entry)
+
+    def add(self, entry):
+        """Add or refresh one entry
+
+        """
+        key = entry.uuid
+        if key in self.values:
+            self._unindex(key)
+        title = keepmenu.safe_deref(entry, "title")
+        group = "/".join(entry.path[:-1])
+        values = {"title": title,
+                  "username": keepmenu.safe_deref(entry, "username"),
+                  "url": keepmenu.safe_deref(entry, "url"),
+                  "group": group,
+                  "path": f"{group}/{title}" if group else title,
+                  "uuid": entry.uuid.hex}
+        values = {k: v.lower() for k, v in values.items()}
+        self.entries[key] = entry
+        self.values[key] = values
+        self._order.setdefault(key, next(self._counter))
+        for field, value in values.items():
+            self._exact[field].setdefault(value, set()).add(key)
+        if self.fulltext:
+            self._text[key] = tokenize(entry_text(entry))
+            for token in self._text[key]:
+                self._postings.setdefault(token, set()).add(key)
+        self._sorted = {}
+
+    update = add
+
+    def remove(self, entry):
+        """Remove one entry
+
+        """
+        key = entry.uuid
+        if key in self.values:
+            self._unindex(key)
+            del self.values[key]
+            del self.entries[key]
+            del self._order[key]
+            self._sorted = {}
+
+    def _unindex(self, key):
+        for field, value in self.values[key].items():
+            keys = self._exact[field].get(value)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._exact[field][value]
+        for token in self._text.pop(key, ()):
+            keys = self._postings[token]
+            keys.discard(key)
+            if not keys:
+                del self._postings[token]
+
+    def _text_keys(self, word):
+        """Return the set of entry keys whose notes or attributes contain all
+        the words of 'word'
+
+        """
+        tokens = tokenize(word)
+        if not self.fulltext or not tokens:
+            return set()
+        return set.intersection(*(self._postings.get(i, set()) for i in tokens))
+
+    def _rank(self, entries, words):
+        """Sort entries by the weight of the fields matching each word. The
+        sort is stable so ties keep database order.
+
+        """
+        def score(entry):
+            values = self.values[entry.uuid]
+            res = 0
+            for word, text_keys in words:
+                weights = [FIELD_WEIGHTS[i] for i in DEFAULT_FIELDS if word in values[i]]
+                if entry.uuid in text_keys:
+                    weights.append(TEXT_WEIGHT)
+                res += max(weights, default=0)
+            return res
+        return sorted(entries, key=score, reverse=True)
+
+    def _prefix(self, field, value):
+        """Return the set of entry keys whose field starts with value
+
+        """
+        if field not in self._sorted:
+            self._sorted[field] = sorted(self._exact[field])
+        values = self._sorted[field]
+        res = set()
+        idx = bisect_left(values, value)
+        while idx < len(values) and values[idx].startswith(value):
+            res.update(self._exact[field][values[idx]])
+            idx += 1
+        return res
+
+    def _plain_search(self, search_string, keys=None):
+        """Original search: the whole string in 'path/title', or every word
+        in any of the searchable fields
+
+        """
+        search_string = search_string.lower()
+        search_terms = [(i, self._text_keys(i)) for i in search_string.split()]
+        res = []
+        for key in self.values if keys is None else keys:
+            values = self.values[key]
+            if search_string in values["path"] or (search_terms and all(
+                    any(term in values[field] for field in DEFAULT_FIELDS) or key in text_keys
+                    for term, text_keys in search_terms)):
+                res.append(self.entries[key])
+        return self._rank(res, search_terms) if self.fulltext else res
+
+    def search(self, search_string, keys=None):
+        """Return the entries matching search_string, in database order or
+        ranked if full text search is enabled
+
+        Args: search_string - string
+              keys - list of entry uuids in database order to search instead
+                     of all entries
+        Returns: list of entries
+
+        """
+        terms = compile_query(search_string)
+        if not terms:
+            return self._plain_search(search_string, keys)
+        candidates = None if keys is None else set(keys)
+        remaining = []
+        for term in terms:
+            if term.field is not None and term.op == "exact":
+                keys = self._exact[term.field].get(term.value, set())
+            elif term.field is not None and term.op == "prefix":
+                keys = self._prefix(term.field, term.value)
+            else:
+                remaining.append(term)
+                continue
+            candidates = keys if candidates is None else candidates & keys
+        text_keys = {i: self._text_keys(i.value) for i in remaining
+                     if i.field is None and i.op == "contains"}
+        res = []
+        for key in self.values if candidates is None else \
+                sorted(candidates, key=self._order.get):
+            values = self.values[key]
+            if all(term.match(values[term.field]) if term.field is not None else
+                   any(term.match(values[field]) for field in DEFAULT_FIELDS) or
+                   key in text_keys.get(term, ())
+                   for term in remaining):
+                res.append(self.entries[key])
+        if self.fulltext:
+            res = self._rank(res, [(i.value, j) for i, j in text_keys.items()])
+        return res
+
+    def group_keys(self, groups):
+        """Return the uuids of the entries in any of the groups or their
+        subgroups, in database order, from the group hash and sorted indexes
+
+        Args: groups - iterable of group paths, e.g. 'Work/VPN'
+        Returns: list of uuids
+
+        """
+        keys = set()
+        for group in groups:
+            group = group.strip("/").lower()
+            if not group:
+                return list(self.values)
+            keys.update(self._exact["group"].get(group, ()))
+            keys.update(self._prefix("group", f"{group}/"))
+        return sorted(keys, key=self._order.get)
+
+    def scope(self, groups=(), query=""):
+        """Return the entries in the groups that match the query
+
+        Args: groups - iterable of group paths. All entries if empty.
+              query - search string (see search()). No filter if empty.
+        Returns: list of entries
+
+        """
+        keys = self.group_keys(groups) if groups else None
+        if query:
+            return self.search(query, keys)
+        return [self.entries[i] for i in (self.values if keys is None else keys)]
+
+
+def normalize_query(search_string):
+    """Return a hashable form of a search string such that equal keys always
+    give equal search results
+
+    """
+    return compile_query(search_string) or search_string.lower()
+
+
+class ResultCache:
+    """Bounded LRU of search results
+
+    Keys are (database path, database generation, full text flag, normalized
+    query), or ('scope', groups, normalized query) in place of the query for
+    --group/--query scopes, and values are the uuids of the matched entries, never the entries
+    or their secrets. The generation must change whenever the database is
+    edited, saved or reloaded so stale results are never served.
+
+    Args: maxsize - int, maximum number of cached queries
+
+    """
+    def __init__(self, maxsize=RESULT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+
+    def get(self, key):
+        """Return the cached uuids for key or None
+
+        """
+        res = self._cache.get(key)
+        if res is not None:
+            self._cache.move_to_end(key)
+        return res
+
+    def put(self, key, uuids):
+        """Store uuids for key, evicting the least recently used keys
+
+        """
+        self._cache[key] = tuple(uuids)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.maxsize:
+            self._cache.popitem(last=False)
+
+    def stats(self):
+        """Return dict of hit/miss counters and size
+
+        """
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._cache),
+                "maxsize": self.maxsize}
+
+
+class CachedIndex:
+    """Search an EntryIndex through a ResultCache
+
+    Args: index - EntryIndex
+          cache - ResultCache
+          dbase - string, database path
+          generation - int, database generation
+
+    """
+    def __init__(self, index, cache, dbase, generation):
+        self.index = index
+        self.entries = index.entries
+        self.cache = cache
+        self.key = (dbase, generation, index.fulltext)
+
+    def search(self, search_string):
+        """Return the entries matching search_string
+
+        """
+        key = self.key + (normalize_query(search_string),)
+        uuids = self.cache.get(key)
+        if uuids is not None and all(i in self.entries for i in uuids):
+            self.cache.hits += 1
+            return [self.entries[i] for i in uuids]
+        self.cache.misses += 1
+        res = self.index.search(search_string)
+        self.cache.put(key, [i.uuid for i in res])
+        return res
+
+    def scope(self, groups=(), query=""):
+        """Return the entries of a --group/--query scope
+
+        """
+        key = self.key + ("scope", tuple(sorted({i.strip("/").lower() for i in groups})),
+                          normalize_query(query))
+        uuids = self.cache.get(key)
+        if uuids is not None and all(i in self.entries for i in uuids):
+            self.cache.hits += 1
+            return [self.entries[i] for i in uuids]
+        self.cache.misses += 1
+        res = self.index.scope(groups, query)
+        self.cache.put(key, [i.uuid for i in res])
+        return res
+
+
+class MergedIndex:
+    """Search several database indexes as one. Results keep the order of
+    the indexes, the current database first.
+
+    Args: indexes - list of CachedIndex, EntryIndex or UrlIndex objects
+
+    """
+    def __init__(self, indexes):
+        self.indexes = indexes
+
+    def search(self, search_string):
+        """Return the entries matching search_string in any database
+
+        """
+        return [j for i in self.indexes for j in i.search(search_string)]
+
+    def lookup(self, url):
+        """Return the entries for a URL in any database
+
+        """
+        return [j for i in self.indexes for j in i.lookup(url)]
+
+
+def normalize_url(url):
+    """Return the (host, path) of a URL for lookups: lower case host without
+    'www.', port or scheme, and the path without a trailing slash
+
+    Args: url - string, with or without scheme
+    Returns: (host, path) or None if there is no usable host
+
+    """
+    if not url:
+        return None
+    try:
+        parts = urlsplit(url.strip() if "//" in url else f"//{url.strip()}")
+        host = (parts.hostname or "").rstrip(".")
+    except ValueError:
+        return None
+    if not host or any(i.isspace() for i in host):
+        return None
+    if host.startswith("www."):
+        host = host[4:]
+    return host, parts.path.rstrip("/")
+
+
+def registrable_domain(host):
+    """Approximate the registrable domain of a host without a public suffix
+    list: the last two labels, or three for two letter country TLDs with a
+    common second level ('example.co.uk'). IP addresses are returned as is.
+
+    """
+    labels = host.split(".")
+    if ":" in host or all(i.isdigit() for i in labels):
+        return host
+    if len(labels) > 2 and len(labels[-1]) == 2 and labels[-2] in PUBLIC_SECOND_LEVELS:
+        return ".".join(labels[-3:])
+    return ".".join(labels[-2:])
+
+
+class UrlIndex:
+    """Entry URLs indexed by registrable domain, host and path
+
+        domains - dict {domain: {host: {path: set of entry uuids}}}
+
+    A lookup tries the URL's host and then its parent hosts up to the
+    registrable domain. On the first host with entries, the entries with the
+    longest matching path prefix are returned, or all of that host's entries
+    if none of their paths match. The cost depends on the number of labels and
+    path segments of the URL, not on the number of entries.
+
+    Args: entries - list of KeePass entries
+
+    """
+    def __init__(self, entries):
+        self.entries = {}
+        self.domains = {}
+        self._keys = {}
+        self._order = {}
+        self._counter = count()
+        for entry in entries:
+            self.add(entry)
+
+    def add(self, entry):
+        """Add or refresh one entry
+
+        """
+        self.remove(entry)
+        parsed = normalize_url(keepmenu.safe_deref(entry, "url"))
+        if parsed is None:
+            return
+        host, path = parsed
+        domain = registrable_domain(host)
+        key = entry.uuid
+        self.entries[key] = entry
+        self._keys[key] = (domain, host, path)
+        self._order.setdefault(key, next(self._counter))
+        self.domains.setdefault(domain, {}).setdefault(host, {}).setdefault(path, set()).add(key)
+
+    update = add
+
+    def remove(self, entry):
+        """Remove one entry
+
+        """
+        location = self._keys.pop(entry.uuid, None)
+        self.entries.pop(entry.uuid, None)
+        if location is None:
+            return
+        domain, host, path = location
+        hosts = self.domains[domain]
+        keys = hosts[host][path]
+        keys.discard(entry.uuid)
+        if not keys:
+            del hosts[host][path]
+            if not hosts[host]:
+                del hosts[host]
+                if not hosts:
+                    del self.domains[domain]
+
+    def lookup(self, url):
+        """Return the entries for a URL, most specific first, in database
+        order
+
+        """
+        parsed = normalize_url(url)
+        if parsed is None:
+            return []
+        host, path = parsed
+        domain = registrable_domain(host)
+        hosts = self.domains.get(domain)
+        if not hosts:
+            return []
+        segments = path.split("/")
+        prefixes = ["/".join(segments[:i]) for i in range(len(segments), 0, -1)]
+        labels = host.split(".")
+        parents = [".".join(labels[i:]) for i in
+                   range(max(len(labels) - len(domain.split(".")), 0) + 1)]
+        for candidate in parents:
+            paths = hosts.get(candidate)
+            if not paths:
+                continue
+            keys = next((paths[i] for i in prefixes if i in paths), None)
+            if keys is None:
+                keys = set().union(*paths.values())
+            return [self.entries[i] for i in sorted(keys, key=self._order.get)]
+        return []
+
+# vim: set et ts=4 sw=4 :
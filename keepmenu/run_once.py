@@ -4,68 +4,180 @@ This module provides functions for running keepmenu commands without
 interactive prompts, suitable for scripting and CLI-only usage.
 """
 
+import json
 from os.path import expanduser
 import keepmenu
 import os
 import sys
+from keepmenu import frecency
 from keepmenu.keepmenu import get_database, get_entries
+from keepmenu.query import EntryIndex, UrlIndex
+from keepmenu.totp import gen_otp, get_otp_url
 from keepmenu.type import type_clipboard
 
+ENTRY_FIELDS = ("title", "username", "password", "url", "notes", "totp", "path")
 
-def search_entries(kp_entries, search_string):
+
+def parse_fields(fields):
+    """Parse a comma separated --fields list
+
+    Args: fields - string, e.g. "username,password,totp,S:api_key"
+    Returns: list of field names. Defaults to ['password'] if fields is empty
+    Raises: ValueError on an unknown field name
+
+    """
+    if not fields:
+        return ["password"]
+    res = []
+    for field in fields.split(","):
+        field = field.strip()
+        if not field:
+            continue
+        if field.lower() in ENTRY_FIELDS:
+            field = field.lower()
+        elif not field.startswith("S:") or len(field) < 3:
+            raise ValueError(f"Unknown field '{field}'. Valid fields: "
+                             f"{', '.join(ENTRY_FIELDS)} or S:<attribute name>")
+        res.append(field)
+    return res or ["password"]
+
+
+def get_fields(entry, fields):
+    """Return the requested field values of an entry
+
+    Args: entry - KeePass entry
+          fields - list of field names from parse_fields
+    Returns: dict {field: value}
+
+    """
+    res = {}
+    for field in fields:
+        if field == "totp":
+            otp_url = get_otp_url(entry)
+            res[field] = gen_otp(otp_url) if otp_url else ""
+        elif field == "path":
+            res[field] = entry_label(entry)
+        elif field.startswith("S:"):
+            res[field] = entry.get_custom_property(field[2:]) or ""
+        else:
+            res[field] = keepmenu.safe_deref(entry, field)
+    return res
+
+
+def search_entries(kp_entries, search_string, index=None):
     """Search for entries matching the search string in title, username, or URL.
 
+    The search string may use field qualifiers (see keepmenu.query), e.g.
+    'group:infra user:deploy title:"db prod"'.
+
     Args:
         kp_entries - list of KeePass entries
         search_string - string to search for
+        index - EntryIndex of kp_entries, to reuse across searches
 
     Returns: list of matching entries
     """
-    search_string_lower = search_string.lower()
-    search_terms = search_string_lower.split()
-    matches = []
-
-    for entry in kp_entries:
-        title = entry.deref("title") or ""
-        username = entry.deref("username") or ""
-        url = entry.deref("url") or ""
-        path = "/".join(entry.path[:-1])
-        full_path_title = f"{path}/{title}" if path else title
-
-        title, username, url, path, full_path_title = \
-            [i.lower() for i in (title, username, url, path, full_path_title)]
-
-        if search_string_lower in full_path_title:
-            matches.append(entry)
-            continue
+    if index is None:
+        index = EntryIndex(kp_entries)
+    return index.search(search_string)
+
+
+def entry_label(entry):
+    """Return the group path and title of an entry, e.g. 'Group/Sub/Title'
+
+    """
+    title = entry.deref("title") or ""
+    path = "/".join(entry.path[:-1])
+    return os.path.join(path, title)
 
-        # Check if all search terms are found in any combination of fields
-        # Include full_path_title in the searchable fields for multi-term search
-        if search_terms and all(
-            any(
-                term in field for field in [title, username, url, path, full_path_title]
-            ) for term in search_terms
-        ):
-            matches.append(entry)
 
-    return matches
+def record_match(dbase, entry, save=True):
+    """Record a single match for frecency ordering
 
+    Args: dbase - database path, dict {PyKeePass object: database path} for
+                  merged searches, or None to not record
+          entry - matched Entry object
+          save - bool, write the frecency store
 
-def show_password(kp_entries, search_string, use_clipboard=False, return_errors=False):
+    Returns: True if the match was recorded
+
+    """
+    if isinstance(dbase, dict):
+        dbase = dbase.get(entry._kp)  # pylint: disable=protected-access
+    if dbase is None or not keepmenu.SETTINGS.frecency:
+        return False
+    frecency.STORE.record(dbase, entry, save=save)
+    return True
+
+
+def show_batch(kp_entries, queries, fields=None, index=None, dbase=None):
+    """Resolve several search strings against the same database.
+
+    Each query produces one result object:
+        {"query": q, "path": p, "fields": {"password": ..., <other field>: ...}}
+        {"query": q, "error": "no_match"}
+        {"query": q, "error": "ambiguous", "matches": [{"path": p, "username": u}, ...]}
+
+    Args:
+        kp_entries - list of KeePass entries
+        queries - list of search strings
+        fields - list of field names to return. Defaults to ['password']
+        index - EntryIndex of kp_entries
+        dbase - database path to record single matches for frecency ordering,
+                or dict {PyKeePass object: database path} for merged searches
+
+    Returns: list of JSON strings, one per query
+    """
+    fields = fields or ["password"]
+    if index is None:
+        index = EntryIndex(kp_entries)
+    results = []
+    recorded = False
+    for query in queries:
+        matches = search_entries(kp_entries, query, index)
+        if not matches:
+            res = {"query": query, "error": "no_match"}
+        elif len(matches) > 1:
+            res = {"query": query,
+                   "error": "ambiguous",
+                   "matches": [{"path": entry_label(i),
+                                "username": i.deref("username") or ""} for i in matches]}
+        else:
+            recorded = record_match(dbase, matches[0], save=False) or recorded
+            res = {"query": query,
+                   "path": entry_label(matches[0]),
+                   "fields": get_fields(matches[0], fields)}
+        results.append(json.dumps(res, ensure_ascii=False))
+    if recorded:
+        frecency.STORE.save()
+    return results
+
+
+def show_password(kp_entries, search_string, use_clipboard=False, return_errors=False,
+                  fields=None, index=None, dbase=None, matches=None):
     """Show password for entries matching the search string.
 
     If multiple entries match, return an error.
-    If only one entry matches, show its password directly.
+    If only one entry matches, show its password directly. If fields are
+    given, return a JSON object with each requested field instead.
 
     Args:
         kp_entries - list of KeePass entries
         search_string - string to search for
         use_clipboard - whether to copy to clipboard instead of stdout
         return_errors - if True, return error messages instead of printing to stderr
+        fields - list of field names from parse_fields, or None for password only
+        index - EntryIndex of kp_entries
+        dbase - database path to record the match for frecency ordering, or
+                dict {PyKeePass object: database path} for merged searches
+        matches - list of entries found by the caller, e.g. a --url lookup,
+                  instead of searching for search_string
 
-    Returns: password string, error string (if return_errors), or None
+    Returns: password string, JSON string (if fields), error string (if
+             return_errors), or None
     """
-    matches = search_entries(kp_entries, search_string)
+    if matches is None:
+        matches = search_entries(kp_entries, search_string, index)
 
     if not matches:
         error_msg = f"No entries found matching '{search_string}'"
@@ -77,10 +189,8 @@ def show_password(kp_entries, search_string, use_clipboard=False, return_errors=
     if len(matches) > 1:
         error_lines = [f"Multiple entries found matching '{search_string}'. Please be more specific."]
         for entry in matches:
-            title = entry.deref("title") or ""
             username = entry.deref("username") or ""
-            path = "/".join(entry.path[:-1])
-            error_lines.append(f"  - {os.path.join(path, title)} ({username})")
+            error_lines.append(f"  - {entry_label(entry)} ({username})")
         if return_errors:
             return "ERROR: " + "\n".join(error_lines)
         for line in error_lines:
@@ -88,13 +198,19 @@ def show_password(kp_entries, search_string, use_clipboard=False, return_errors=
         return None
 
     entry = matches[0]
-    password = entry.deref("password") or ""
+    record_match(dbase, entry)
+    if fields:
+        values = get_fields(entry, fields)
+        password = values[fields[0]]
+    else:
+        password = entry.deref("password") or ""
 
     if use_clipboard:
         type_clipboard(password)
         return None
-    else:
-        return password  # Return password instead of printing it
+    if fields:
+        return json.dumps(values, ensure_ascii=False)
+    return password  # Return password instead of printing it
 
 
 def run_once(db=None, **kwargs):
@@ -107,15 +223,33 @@ def run_once(db=None, **kwargs):
           keyfile - path to keyfile
           clipboard - use clipboard
           show - search string to show password
+          show_batch - list of search strings, answered as JSON lines
+          url - URL to look up the entry by instead of a search string
+          url_index - UrlIndex of the already unlocked db, if available
+          sources - dict {PyKeePass object: database path} when index spans
+                    several databases
+          fields - comma separated field names to return instead of the password
+          index - EntryIndex of the already unlocked db, if available
           return_errors - if True, return error messages instead of printing to stderr
 
-    Returns: password string if show option is used, otherwise None
+    Returns: password string if show option is used, newline separated JSON
+             results if show_batch is used, otherwise None
     """
-    # Ensure configuration is loaded
     cfile = kwargs.get("config")
     keepmenu.CLIPBOARD = kwargs.get("clipboard", False)
-    keepmenu.reload_config(None if cfile is None else expanduser(cfile))
+    if db is None:
+        # Ensure configuration is loaded. The daemon passes db and reloads the
+        # config itself when the file changes (see DmenuRunner._check_config).
+        keepmenu.reload_config(None if cfile is None else expanduser(cfile),
+                               reprobe=kwargs.get("reprobe", False))
     return_errors = kwargs.get("return_errors", False)
+    try:
+        fields = parse_fields(kwargs.get("fields"))
+    except ValueError as err:
+        if return_errors:
+            return f"ERROR: {err}"
+        print(err, file=sys.stderr)
+        return None
 
     if db is None:
         db, _ = get_database(cli=True, **kwargs)
@@ -126,8 +260,9 @@ def run_once(db=None, **kwargs):
             print(error_msg, file=sys.stderr)
             return None
 
-        # Get entries
-        db.kpo = get_entries(db, cli_mode=True)
+        # Get entries, unless get_database already unlocked the database
+        if db.kpo is None:
+            db.kpo = get_entries(db, cli_mode=True)
         if db.kpo is None:
             error_msg = "Error: Could not retrieve entries from database"
             if return_errors:
@@ -135,5 +270,17 @@ def run_once(db=None, **kwargs):
             print(error_msg, file=sys.stderr)
             return None
 
+    if kwargs.get("show_batch"):
+        return "\n".join(show_batch(db.kpo.entries, kwargs["show_batch"], fields,
+                                     index=kwargs.get("index"),
+                                     dbase=kwargs.get("sources") or db.dbase))
+    matches = None
     search = kwargs.get("show", "")
-    return show_password(db.kpo.entries, search, keepmenu.CLIPBOARD, return_errors=return_errors)
+    if kwargs.get("url"):
+        search = kwargs["url"]
+        url_index = kwargs.get("url_index") or UrlIndex(db.kpo.entries)
+        matches = url_index.lookup(search)
+    return show_password(db.kpo.entries, search, keepmenu.CLIPBOARD, return_errors=return_errors,
+                         fields=fields if kwargs.get("fields") else None,
+                         index=kwargs.get("index"), dbase=kwargs.get("sources") or db.dbase,
+                         matches=matches)
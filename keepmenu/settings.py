@@ -0,0 +1,235 @@
+"""Typed settings parsed from config.ini
+
+reload_config() builds a new Settings object and swaps it into
+keepmenu.SETTINGS in one assignment, so menus never see a half loaded config.
+
+"""
+from dataclasses import dataclass, field
+import os
+import shlex
+import string
+
+from keepmenu.menu import LauncherProfile
+from keepmenu.window import PROVIDERS
+
+TYPE_LIBRARIES = ("pynput", "xdotool", "ydotool", "wtype", "dotool", "dotoolc")
+
+
+def password_presets(conf, errors):
+    """Build the password character set presets
+
+    Args: conf - ConfigParser
+          errors - list, invalid values are reported here
+    Returns: tuple of (preset name, tuple of (set name, characters))
+
+    """
+    chars = {"upper": string.ascii_uppercase,
+             "lower": string.ascii_lowercase,
+             "digits": string.digits,
+             "punctuation": string.punctuation}
+    presets = {}
+    presets["Letters+Digits+Punctuation"] = dict(chars)
+    presets["Letters+Digits"] = {k: chars[k] for k in ("upper", "lower", "digits")}
+    presets["Letters"] = {k: chars[k] for k in ("upper", "lower")}
+    presets["Digits"] = {k: chars[k] for k in ("digits",)}
+    if conf.has_section('password_chars'):
+        pw_chars = dict(conf.items('password_chars'))
+        chars.update(pw_chars)
+        presets["Letters+Digits+Punctuation"] = dict(chars)
+        for key in pw_chars:
+            presets[key.title()] = {k: chars[k] for k in (key,)}
+    if conf.has_section('password_char_presets'):
+        if conf.options('password_char_presets'):
+            presets = {}
+        for name, val in conf.items('password_char_presets'):
+            try:
+                presets[name.title()] = {k: chars[k] for k in shlex.split(val)}
+            except (KeyError, ValueError):
+                errors.append(f"Unknown value in password_char_presets '{name}'. Ignoring.")
+    return tuple((k, tuple(v.items())) for k, v in presets.items())
+
+
+@dataclass(frozen=True)
+class Settings:  # pylint: disable=too-many-instance-attributes
+    """Validated config values used while the menus are running
+
+        launcher - LauncherProfile
+        type_library - string, one of TYPE_LIBRARIES
+        type_url - bool, type the URL instead of opening it
+        title_path - bool or int, show the database path in the prompt
+                     (see view.generate_prompt). None if not set.
+        hide_groups - tuple of group names hidden from the entry lists
+        password_presets - tuple of (name, tuple of (set name, chars))
+        fulltext_search - bool
+        frecency - bool, list often and recently used entries first
+        page_size - int, entries per launcher invocation. 0 shows all
+                    entries at once.
+        group_browser - bool, show one group level per menu
+        window_match - bool, match entries against the focused window
+        window_provider - string, 'auto' or one of window.PROVIDERS
+        merge_databases - bool, list and search all unlocked databases
+        password_cmd_cache_min - int, minutes to keep password_cmd output.
+                                 None uses pw_cache_period_min.
+        preunlock - bool, unlock config-passwordable databases in the
+                    background when the daemon starts
+        db_idle_min - int, minutes before an unused database other than the
+                      current one is locked. 0 never locks it.
+        memory_budget_mb - int, estimated memory of the unlocked databases
+                           above which the least recently used ones are
+                           locked. 0 for no limit.
+        cache_period_min - int, pw_cache_period_min. None if not set.
+        max_len - int, number of lines from '-l' in dmenu_command. None if
+                  not set.
+
+    """
+    launcher: LauncherProfile = field(default_factory=LauncherProfile)
+    type_library: str = "pynput"
+    type_url: bool = False
+    title_path: object = None
+    hide_groups: tuple = ()
+    password_presets: tuple = ()
+    fulltext_search: bool = False
+    frecency: bool = False
+    page_size: int = 0
+    group_browser: bool = False
+    window_match: bool = False
+    window_provider: str = "auto"
+    merge_databases: bool = False
+    password_cmd_cache_min: int = None
+    preunlock: bool = False
+    db_idle_min: int = 0
+    memory_budget_mb: int = 0
+    cache_period_min: int = None
+    max_len: int = None
+
+    @classmethod
+    def from_config(cls, conf):
+        """Parse and validate a ConfigParser
+
+        Args: conf - ConfigParser
+        Returns: (Settings, list of error strings). Invalid values are
+                 replaced by their defaults.
+
+        """
+        errors = []
+
+        def getboolean(section, option):
+            try:
+                return conf.getboolean(section, option, fallback=False)
+            except ValueError:
+                errors.append(f"Invalid value for {option}: "
+                              f"'{conf.get(section, option)}'. Using False.")
+                return False
+
+        def getint(section, option):
+            try:
+                return max(conf.getint(section, option, fallback=0), 0)
+            except ValueError:
+                errors.append(f"Invalid value for {option}: "
+                              f"'{conf.get(section, option)}'. Using 0.")
+                return 0
+
+        type_library = conf.get('database', 'type_library', fallback='pynput')
+        if type_library not in TYPE_LIBRARIES:
+            errors.append(f"Unknown type_library '{type_library}'. Using pynput.")
+            type_library = "pynput"
+        title_path = None
+        if conf.has_option('dmenu', 'title_path'):
+            try:
+                title_path = conf.getboolean('dmenu', 'title_path')
+            except ValueError:
+                try:
+                    title_path = conf.getint('dmenu', 'title_path')
+                except ValueError:
+                    errors.append("title_path must be True, False or a number: "
+                                  f"'{conf.get('dmenu', 'title_path')}'. Ignoring.")
+        page_size = 0
+        try:
+            page_size = max(conf.getint('dmenu', 'page_size', fallback=0), 0)
+        except ValueError:
+            errors.append(f"Invalid value for page_size: '{conf.get('dmenu', 'page_size')}'. "
+                          "Showing all entries.")
+        password_cmd_cache_min = None
+        if conf.has_option('database', 'password_cmd_cache_min'):
+            try:
+                password_cmd_cache_min = max(conf.getint('database', 'password_cmd_cache_min'), 0)
+            except ValueError:
+                errors.append("Invalid value for password_cmd_cache_min: "
+                              f"'{conf.get('database', 'password_cmd_cache_min')}'. "
+                              "Using pw_cache_period_min.")
+        cache_period_min = None
+        if conf.has_option('database', 'pw_cache_period_min'):
+            try:
+                cache_period_min = conf.getint('database', 'pw_cache_period_min')
+            except ValueError:
+                errors.append("Invalid value for pw_cache_period_min: "
+                              f"'{conf.get('database', 'pw_cache_period_min')}'. "
+                              "Using the default.")
+        max_len = None
+        try:
+            command = shlex.split(conf.get('dmenu', 'dmenu_command', fallback='dmenu'))
+        except ValueError:
+            command = []
+        if "-l" in command:
+            try:
+                max_len = int(command[command.index("-l") + 1])
+            except (ValueError, IndexError):
+                errors.append("Invalid number of lines after -l in dmenu_command. Ignoring.")
+        window_provider = conf.get('database', 'window_provider', fallback='auto')
+        if window_provider != "auto" and window_provider not in PROVIDERS:
+            errors.append(f"Unknown window_provider '{window_provider}'. Using auto.")
+            window_provider = "auto"
+        hide_groups = tuple(i.strip() for i in
+                            conf.get('database', 'hide_groups', fallback='').split("\n")
+                            if i.strip())
+        settings = cls(launcher=LauncherProfile.from_config(conf),
+                       type_library=type_library,
+                       type_url=getboolean('database', 'type_url'),
+                       title_path=title_path,
+                       hide_groups=hide_groups,
+                       password_presets=password_presets(conf, errors),
+                       fulltext_search=getboolean('database', 'fulltext_search'),
+                       frecency=getboolean('database', 'frecency'),
+                       page_size=page_size,
+                       group_browser=getboolean('dmenu', 'group_browser'),
+                       window_match=getboolean('database', 'window_match'),
+                       window_provider=window_provider,
+                       merge_databases=getboolean('database', 'merge_databases'),
+                       password_cmd_cache_min=password_cmd_cache_min,
+                       preunlock=getboolean('database', 'preunlock'),
+                       db_idle_min=getint('database', 'db_idle_min'),
+                       memory_budget_mb=getint('database', 'memory_budget_mb'),
+                       cache_period_min=cache_period_min,
+                       max_len=max_len)
+        return settings, errors
+
+
+class ConfigWatcher:
+    """Detect changes to the config file from its inode, size and mtime
+
+    Args: path - config file path
+
+    """
+    def __init__(self, path):
+        self.path = path
+        self.signature = self._stat()
+
+    def _stat(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+    def changed(self):
+        """Return True once for each change of the config file. A removed file
+        is not reported so the current settings are kept.
+
+        """
+        signature = self._stat()
+        if signature == self.signature:
+            return False
+        self.signature = signature
+        return signature is not None
+
+# vim: set et ts=4 sw=4 :
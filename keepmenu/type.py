@@ -124,7 +124,7 @@ def type_entry(entry, db_autotype=None):
                  'wtype': type_entry_wtype,
                  'dotool': type_entry_dotool,
                  'dotoolc': type_entry_dotoolc}
-    library = keepmenu.CONF.get('database', 'type_library', fallback='pynput')
+    library = keepmenu.SETTINGS.type_library
     libraries.get(library, type_entry_pynput)(entry, tokens)
 
 PLACEHOLDER_AUTOTYPE_TOKENS = {
@@ -377,9 +377,7 @@ def type_text(data):
     if keepmenu.CLIPBOARD is True:
         type_clipboard(data)
         return
-    library = 'pynput'
-    if keepmenu.CONF.has_option('database', 'type_library'):
-        library = keepmenu.CONF.get('database', 'type_library')
+    library = keepmenu.SETTINGS.type_library
     if library == 'xdotool':
         call(['xdotool', 'type', '--', data])
     elif library == 'ydotool':
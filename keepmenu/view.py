@@ -1,47 +1,184 @@
 """Methods to view database items
 
 """
+from itertools import chain
 import os.path
 import webbrowser
 
 import keepmenu
+from keepmenu import frecency
+from keepmenu.groups import GroupTree, UP
 from keepmenu.menu import dmenu_select
 from keepmenu.totp import gen_otp, get_otp_url, TOTP_FIELDS
 
 
-def view_all_entries(options, kp_entries, dbname):
-    """Generate numbered list of all Keepass entries and open with dmenu.
+# Extra lines shown when the entry list is split into pages
+MORE = "More…"
+BROWSE_GROUPS = "Browse groups…"
 
-    Returns: dmenu selection
+
+def view_all_entries(options, kp_entries, dbname, top=(), sources=None):
+    """Generate list of all Keepass entries and open with dmenu.
+
+    Launchers that can output the index of the selected line (rofi, fuzzel)
+    are asked for it. Otherwise each line is numbered with the entry's index
+    in kp_entries so duplicates can be told apart.
+
+    With the 'frecency' option, often and recently used entries are listed
+    first. With 'group_browser', one group's subgroups and entries are shown
+    at a time. With 'page_size', only that many entries are passed to the
+    launcher at a time, followed by MORE to show the next page and
+    BROWSE_GROUPS to pick the entries of one group. Entries from several
+    databases are tagged with their database name.
+
+    Args: options - list of menu option strings shown before the entries
+          kp_entries - list of Entry objects
+          dbname - database path
+          top - list of entries listed before all others, e.g. the entries
+                matching the focused window
+          sources - dict {PyKeePass object: database path} if the entries
+                    come from several databases
+    Returns: selected option string, selected Entry or None
+
+    """
+    order = range(len(kp_entries))
+    tags = None
+    if sources:
+        dbases = [sources[i._kp] for i in kp_entries]  # pylint: disable=protected-access
+        tags = [f"[{os.path.splitext(os.path.basename(i))[0]}] " for i in dbases]
+    if keepmenu.SETTINGS.frecency:
+        order = frecency.STORE.order(dbases if sources else dbname, kp_entries)
+    if top:
+        top = {i.uuid for i in top}
+        order = [i for i in order if kp_entries[i].uuid in top] + \
+            [i for i in order if kp_entries[i].uuid not in top]
+    # The group tree is per database
+    if keepmenu.SETTINGS.group_browser and kp_entries and not sources:
+        return view_tree(options, kp_entries, order, dbname)
+    page_size = keepmenu.SETTINGS.page_size
+    if not page_size or len(kp_entries) <= page_size:
+        return select_entry(options, kp_entries, order, dbname, tags=tags)
+    return view_pages(options, kp_entries, order, dbname, page_size, tags)
+
+
+def view_tree(options, kp_entries, order, dbname):
+    """Show the entries one group at a time, with the subgroups that contain
+    any of them listed before the entries
+
+    Args: options - list of menu option strings shown in the root group
+          kp_entries - list of Entry objects of one database
+          order - sequence of indexes of kp_entries in display order
+          dbname - database path
+    Returns: selected option string, selected Entry or None
 
     """
+    tree = GroupTree(kp_entries[0]._kp)  # pylint: disable=protected-access
+    members, counts = tree.index_entries(kp_entries, order)
+    stack = [tree.root]
+    while True:
+        group = stack[-1]
+        labels = {f"{i.name}/": i for i in tree.children.get(group.uuid, [])
+                  if counts.get(i.uuid)}
+        top = list(options) if len(stack) == 1 else [UP]
+        sel = select_entry(top + list(labels), kp_entries, members.get(group.uuid, []), dbname)
+        if sel == UP and len(stack) > 1:
+            stack.pop()
+        elif isinstance(sel, str) and sel in labels:
+            stack.append(labels[sel])
+        else:
+            return sel
+
+
+def view_pages(options, kp_entries, order, dbname, page_size, tags=None):
+    """Show the entries one page at a time. Pages are formatted only when
+    MORE is selected.
+
+    Args: options - list of menu option strings shown on the first page
+          kp_entries - list of Entry objects
+          order - sequence of indexes of kp_entries in display order
+          dbname - database path
+          page_size - int, number of entries per page
+          tags - list of database tags of kp_entries, or None
+    Returns: selected option string, selected Entry or None
+
+    """
+    start = 0
+    while True:
+        extra = [MORE] if start + page_size < len(order) else []
+        extra.append(BROWSE_GROUPS)
+        sel = select_entry(options if start == 0 else [], kp_entries,
+                           order[start:start + page_size], dbname, extra, tags)
+        if sel == MORE:
+            start += page_size
+        elif sel == BROWSE_GROUPS:
+            groups = sorted({"/".join(kp_entries[i].path[:-1]) for i in order})
+            group = dmenu_select(min(keepmenu.MAX_LEN, len(groups)), "Groups",
+                                 inp="\n".join(groups))
+            if group not in groups:
+                return None
+            order = [i for i in order if "/".join(kp_entries[i].path[:-1]) == group]
+            options, start = [], 0
+        else:
+            return sel
+
+
+def select_entry(options, kp_entries, order, dbname, extra=(), tags=None):
+    """Show the options, the entries in order and the extra lines in the
+    launcher
+
+    Args: options - list of menu option strings shown before the entries
+          kp_entries - list of Entry objects
+          order - sequence of indexes of the kp_entries to show
+          dbname - database path
+          extra - list of strings shown after the entries
+          tags - list of strings prefixed to the path of each of kp_entries,
+                 or None
+    Returns: selected option or extra string, selected Entry or None
+
+    """
+    index = bool(keepmenu.SETTINGS.launcher.index_args)
     num_align = len(str(len(kp_entries)))
-    kp_entry_pattern = str("{:>{na}} - {} - {} - {}")  # Path,username,url
-    # Have to number each entry to capture duplicates correctly
-    kps = str("\n").join([kp_entry_pattern.format(j,
-                                                  os.path.join("/".join(i.path[:-1]),
-                                                               keepmenu.safe_deref(i, 'title')),
-                                                  keepmenu.safe_deref(i, 'username'),
-                                                  keepmenu.safe_deref(i, 'url'),
-                                                  na=num_align)
-                         for j, i in enumerate(kp_entries)])
-    if options:
-        options_s = "\n".join(options) + "\n"
-        entries_s = options_s + kps
-    else:
-        entries_s = kps
+    # Path,username,url
+    kp_entry_pattern = str("{2} - {3} - {4}") if index else str("{0:>{1}} - {2} - {3} - {4}")
+    # Lines are generated while they are streamed to the launcher.
+    kps = (kp_entry_pattern.format(j,
+                                   num_align,
+                                   (tags[j] if tags else "") +
+                                   os.path.join("/".join(i.path[:-1]),
+                                                keepmenu.safe_deref(i, 'title')),
+                                   keepmenu.safe_deref(i, 'username'),
+                                   keepmenu.safe_deref(i, 'url'))
+           for j, i in ((k, kp_entries[k]) for k in order))
+    entries_s = chain(options, kps, extra)
 
     prompt = f"Entries: {dbname}"
-    if keepmenu.CONF.has_option('dmenu', 'title_path'):
+    if keepmenu.SETTINGS.title_path is not None:
+        prompt = generate_prompt(keepmenu.SETTINGS.title_path, dbname)
+
+    sel = dmenu_select(min(keepmenu.MAX_LEN, len(options) + len(order) + len(extra)),
+                       inp=entries_s,
+                       prompt=prompt,
+                       index=index)
+    if not sel:
+        return None
+    if index:
         try:
-            max_length = keepmenu.CONF.getboolean('dmenu', 'title_path')
+            num = int(sel)
         except ValueError:
-            max_length = keepmenu.CONF.getint('dmenu', 'title_path')
-        prompt = generate_prompt(max_length, dbname)
-
-    return dmenu_select(min(keepmenu.MAX_LEN, len(options) + len(kp_entries)),
-                        inp=entries_s,
-                        prompt=prompt)
+            return None
+        if 0 <= num < len(options):
+            return options[num]
+        num -= len(options)
+        if 0 <= num < len(order):
+            return kp_entries[order[num]]
+        num -= len(order)
+        return extra[num] if 0 <= num < len(extra) else None
+    if sel in options or sel in extra:
+        return sel
+    try:
+        return kp_entries[int(sel.split('-', 1)[0])]
+    except (ValueError, IndexError):
+        return None
 
 
 def view_entry(kp_entry):
@@ -81,7 +218,7 @@ def view_entry(kp_entry):
         sel = keepmenu.safe_deref(kp_entry, 'password')
     elif sel == "TOTP: ******":
         sel = gen_otp(get_otp_url(kp_entry))
-    elif sel == fields[4] and not keepmenu.CONF.getboolean("database", "type_url", fallback=False):
+    elif sel == fields[4] and not keepmenu.SETTINGS.type_url:
         if sel != "URL: None":
             webbrowser.open(sel)
         sel = ""
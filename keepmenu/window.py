@@ -0,0 +1,169 @@
+"""Match entries against the title of the focused window, like KeePass global
+auto-type
+
+An entry matches when its title or the main label of its URL host appears as
+whole words in the window title, or when one of its auto-type window
+associations (a glob, e.g. '*Firefox*') matches the whole window title.
+
+"""
+from fnmatch import fnmatchcase
+import json
+import os
+import re
+from subprocess import run
+from urllib.parse import urlsplit
+
+import keepmenu
+
+WORD_RE = re.compile(r"\w+")
+# Entry titles shorter than this are too ambiguous to match on
+MIN_TITLE_LEN = 3
+# Second level labels that don't identify a site
+GENERIC_LABELS = {"com", "net", "org", "co", "www", "login", "mail", "localhost"}
+
+
+def xdotool_title():
+    """Return the focused window title on X11"""
+    res = run(["xdotool", "getactivewindow", "getwindowname"], check=False,
+              capture_output=True, encoding=keepmenu.ENC, env=keepmenu.ENV)
+    return res.stdout.strip() if res.returncode == 0 else None
+
+
+def sway_title():
+    """Return the focused window title on sway"""
+    res = run(["swaymsg", "-t", "get_tree"], check=False, capture_output=True,
+              encoding=keepmenu.ENC, env=keepmenu.ENV)
+    try:
+        pending = [json.loads(res.stdout)]
+    except ValueError:
+        return None
+    while pending:
+        node = pending.pop()
+        if node.get("focused") and node.get("type") in ("con", "floating_con"):
+            return node.get("name")
+        pending.extend(node.get("nodes", []) + node.get("floating_nodes", []))
+    return None
+
+
+def hyprland_title():
+    """Return the focused window title on Hyprland"""
+    res = run(["hyprctl", "activewindow", "-j"], check=False, capture_output=True,
+              encoding=keepmenu.ENC, env=keepmenu.ENV)
+    try:
+        return json.loads(res.stdout).get("title")
+    except (ValueError, AttributeError):
+        return None
+
+
+def fake_title():
+    """Return $KEEPMENU_WINDOW_TITLE, for testing"""
+    return os.environ.get("KEEPMENU_WINDOW_TITLE")
+
+
+PROVIDERS = {"xdotool": xdotool_title,
+             "sway": sway_title,
+             "hyprland": hyprland_title,
+             "fake": fake_title}
+
+
+def detect_provider():
+    """Return the provider name for the running session
+
+    """
+    if os.environ.get("HYPRLAND_INSTANCE_SIGNATURE"):
+        return "hyprland"
+    if os.environ.get("SWAYSOCK"):
+        return "sway"
+    return "xdotool"
+
+
+def active_title(provider="auto"):
+    """Return the title of the focused window or None
+
+    Args: provider - name in PROVIDERS or 'auto'
+
+    """
+    if provider == "auto":
+        provider = detect_provider()
+    try:
+        return PROVIDERS[provider]() or None
+    except (OSError, KeyError):
+        return None
+
+
+def url_label(url):
+    """Return the main label of a URL host, e.g. 'github' for
+    https://www.github.com/login, or None
+
+    """
+    if not url:
+        return None
+    try:
+        host = urlsplit(url if "//" in url else f"//{url}").hostname or ""
+    except ValueError:
+        return None
+    labels = [i for i in host.split(".") if i]
+    if len(labels) > 1:
+        labels = labels[:-1]
+    label = labels[-1] if labels else ""
+    if len(label) < MIN_TITLE_LEN or label.isdigit() or label in GENERIC_LABELS:
+        return None
+    return label
+
+
+class WindowIndex:
+    """Entry titles, URL host labels and auto-type window associations,
+    indexed by their first word so matching a window title only looks at the
+    entries sharing a word with it
+
+    Args: entries - list of KeePass entries
+
+    """
+    def __init__(self, entries):
+        self.words = {}
+        self.patterns = []
+        for entry in entries:
+            title = (keepmenu.safe_deref(entry, 'title') or "").lower()
+            words = WORD_RE.findall(title)
+            if len(title) >= MIN_TITLE_LEN and words:
+                self.words.setdefault(words[0], []).append((tuple(words), entry))
+            label = url_label(keepmenu.safe_deref(entry, 'url'))
+            if label is not None:
+                self.words.setdefault(label, []).append(((label,), entry))
+            for window in entry._element.findall('AutoType/Association/Window'):  # pylint: disable=protected-access
+                if window.text:
+                    self.patterns.append((window.text.lower(), entry))
+
+    def match(self, title):
+        """Return the entries matching a window title, without duplicates
+
+        """
+        if not title:
+            return []
+        title = title.lower()
+        words = WORD_RE.findall(title)
+        res = {}
+        for idx, word in enumerate(words):
+            for phrase, entry in self.words.get(word, ()):
+                if tuple(words[idx:idx + len(phrase)]) == phrase:
+                    res.setdefault(entry.uuid, entry)
+        for entry in self.associated(title):
+            res.setdefault(entry.uuid, entry)
+        return list(res.values())
+
+    def associated(self, title):
+        """Return the entries with an auto-type window association matching a
+        window title, without duplicates. Unlike title and URL matches these
+        were set up for the window on purpose.
+
+        """
+        if not title:
+            return []
+        title = title.lower()
+        res = {}
+        for pattern, entry in self.patterns:
+            if fnmatchcase(title, pattern):
+                res.setdefault(entry.uuid, entry)
+        return list(res.values())
+
+# vim: set et ts=4 sw=4 :
@@ -0,0 +1,61 @@
+"""Measure client cold-start import time of keepmenu
+
+Runs `python -X importtime -c "import keepmenu.__main__"` several times in a
+fresh interpreter and reports the cumulative import time of keepmenu.__main__
+and the slowest modules it pulls in.
+
+Usage: python tests/bench_import.py [-n RUNS] [-t TOP]
+
+"""
+import argparse
+import os
+from os.path import abspath, dirname
+from statistics import median
+import subprocess
+import sys
+
+ROOT = dirname(dirname(abspath(__file__)))
+
+
+def import_times():
+    """Import keepmenu.__main__ in a fresh interpreter
+
+    Returns: dict of module name -> cumulative import time (us)
+
+    """
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    res = subprocess.run([sys.executable, "-X", "importtime", "-c", "import keepmenu.__main__"],
+                         env=env, capture_output=True, text=True, check=True)
+    times = {}
+    for line in res.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def main():
+    """Print median client import time over several runs
+
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-n", "--runs", type=int, default=10)
+    parser.add_argument("-t", "--top", type=int, default=10)
+    args = parser.parse_args()
+    runs = [import_times() for _ in range(args.runs)]
+    total = median(i["keepmenu.__main__"] for i in runs)
+    print(f"keepmenu.__main__: {total / 1000:.1f} ms (median of {args.runs} runs)")
+    print(f"modules imported: {len(runs[-1])}")
+    heavy = [i for i in ("keepmenu.keepmenu", "pykeepass", "construct") if i in runs[-1]]
+    if heavy:
+        print(f"WARNING: client path imports {', '.join(heavy)}")
+    print(f"slowest {args.top}:")
+    for name, usec in sorted(runs[-1].items(), key=lambda i: i[1], reverse=True)[1:args.top + 1]:
+        print(f"  {usec / 1000:8.1f} ms  {name}")
+
+
+if __name__ == '__main__':
+    main()
+
+# vim: set et ts=4 sw=4 :
@@ -0,0 +1,92 @@
+"""Measure launcher time-to-first-paint for large databases
+
+Formats a synthetic database of N entries with view_all_entries and feeds it
+to a stand-in launcher that records when it received its first screen of
+lines (-l lines) and when stdin was closed. Compares the streamed entry list
+with building the whole input string first.
+
+Usage: python tests/bench_menu.py [-n ENTRIES] [-l LINES] [-r RUNS]
+
+"""
+import argparse
+import os
+from os.path import abspath, dirname
+from statistics import median
+import sys
+import tempfile
+import time
+from unittest import mock
+import uuid
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+import keepmenu  # noqa: E402 pylint: disable=wrong-import-position
+from keepmenu import menu, view  # noqa: E402 pylint: disable=wrong-import-position
+from keepmenu.settings import Settings  # noqa: E402 pylint: disable=wrong-import-position
+
+LAUNCHER = """
+import sys, time
+lines, first = 0, None
+for line in sys.stdin:
+    lines += 1
+    if lines == {lines} and first is None:
+        first = time.time()
+print(first or time.time(), time.time())
+"""
+
+
+class FakeEntry:  # pylint: disable=too-few-public-methods
+    """Minimal stand-in for a pykeepass Entry"""
+    def __init__(self, num):
+        self.uuid = uuid.uuid4()
+        self.title = f"Entry {num}"
+        self.username = f"user{num}@example.com"
+        self.url = f"https://service{num}.example.com/login"
+        self.path = ["Group", f"Sub {num % 50}", self.title]
+
+
+def run_menu(entries, lines, stream):
+    """Show the entries to the stand-in launcher
+
+    Returns: (time to first screen, time until all lines were read) in seconds
+
+    """
+    launcher = [sys.executable, "-c", LAUNCHER.format(lines=lines)]
+    keepmenu.SETTINGS = Settings(launcher=menu.LauncherProfile(tuple(launcher)))
+    real_select = menu.dmenu_select
+    out = []
+
+    def select(num_lines, prompt="Entries", inp="", index=False):
+        out.append(real_select(num_lines, prompt, inp if stream else "\n".join(inp), index))
+        return ""
+
+    start = time.time()
+    with mock.patch.object(view, "dmenu_select", select):
+        view.view_all_entries([], entries, "bench.kdbx")
+    first, last = map(float, out[0].split())
+    return first - start, last - start
+
+
+def main():
+    """Print median time-to-first-paint with and without streaming
+
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-n", "--entries", type=int, default=20000)
+    parser.add_argument("-l", "--lines", type=int, default=keepmenu.MAX_LEN)
+    parser.add_argument("-r", "--runs", type=int, default=5)
+    args = parser.parse_args()
+    keepmenu.CONF_FILE = os.path.join(tempfile.mkdtemp(), "config.ini")
+    entries = [FakeEntry(i) for i in range(args.entries)]
+    print(f"{args.entries} entries, first screen = {args.lines} lines")
+    for stream in (False, True):
+        runs = [run_menu(entries, args.lines, stream) for _ in range(args.runs)]
+        print(f"{'streamed' if stream else 'string  '}: "
+              f"first paint {median(i[0] for i in runs) * 1000:7.1f} ms, "
+              f"all lines {median(i[1] for i in runs) * 1000:7.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
+
+# vim: set et ts=4 sw=4 :
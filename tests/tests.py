@@ -1,15 +1,22 @@
 """Unit tests for keepmenu
 
 """
+import configparser
+from copy import copy
+from datetime import datetime, timedelta, timezone
+import gc
+import json
 from multiprocessing.managers import BaseManager
 import os
 from shutil import copyfile, rmtree
 import socket
 import string
+import subprocess
 import sys
 import tempfile
 import unittest
 from unittest import mock
+import weakref
 from pykeepass import PyKeePass
 
 import keepmenu as KM
@@ -124,6 +131,18 @@ class TestServer(unittest.TestCase):
         """
         self.assertRaises(socket.error, KM.__main__.client, port=1, auth='abcd'.encode(KM.ENC))
 
+    def test_client_imports(self):
+        """Ensure the client path doesn't import the database and menu modules
+        or create the runtime directory at import
+
+        """
+        code = ("import sys, keepmenu.__main__; "
+                "print(' '.join(i for i in ('keepmenu.keepmenu', 'pykeepass', 'construct') "
+                "if i in sys.modules)); print('AUTH_FILE' in vars(sys.modules['keepmenu']))")
+        res = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                             check=True, env=dict(os.environ, PYTHONPATH=os.getcwd()))
+        self.assertEqual(res.stdout.splitlines(), ["", "False"])
+
     def test_server(self):
         """Ensure BaseManager server starts
 
@@ -182,6 +201,99 @@ class TestFunctions(unittest.TestCase):
                "-l", "20", "-nb", "#222222", "-nf", "#222222", ]
         self.assertTrue(KM.menu.dmenu_cmd(20, "Password") == res)
 
+    def test_stream_to_launcher(self):
+        """Test menu lines are streamed to the launcher, also when it exits
+        before reading all of them
+
+        """
+        lines = (f"line {i}" for i in range(100000))
+        cmd = [sys.executable, "-c",
+               "import sys; lines = sys.stdin.read().splitlines(); print(len(lines), lines[5000])"]
+        res = KM.menu.stream_to_launcher(cmd, lines, chunk_size=100)
+        self.assertEqual(res.stdout.strip(), "100000 line 5000")
+        cmd = [sys.executable, "-c", "import sys; print(sys.stdin.readline().strip())"]
+        res = KM.menu.stream_to_launcher(cmd, (f"line {i}" for i in range(1000000)))
+        self.assertEqual(res.stdout.strip(), "line 0")
+        self.assertEqual(res.returncode, 0)
+
+    def test_launcher_profile(self):
+        """Test menu commands are built from the launcher profile without
+        reading the config or running the launcher
+
+        """
+        self.addCleanup(setattr, KM, "SETTINGS", KM.SETTINGS)
+        self.addCleanup(setattr, KM, "CONF", KM.CONF)
+        KM.reload_config(os.path.join(self.tmpdir, "config.ini"))
+        KM.CONF.set("dmenu", "dmenu_command", "wofi -i")
+        with mock.patch("keepmenu.run") as run, mock.patch("keepmenu.menu.run") as mrun:
+            self.assertEqual(KM.menu.dmenu_cmd(10, "Password"),
+                             ["dmenu", "-p", "Password", "-l", "10", "-nb", "#222222",
+                              "-nf", "#222222"])
+            self.assertFalse(run.called or mrun.called)
+        KM.SETTINGS = KM.settings.Settings.from_config(KM.CONF)[0]
+        self.assertEqual(KM.menu.dmenu_cmd(10, "Password"),
+                         ["wofi", "-i", "--dmenu", "-p", "Password", "-L", "11", "-P"])
+
+    def test_launcher_session(self):
+        """Test the menus of a flow share one session process and fall back to
+        one-shot launchers when it fails
+
+        """
+        log = os.path.join(self.tmpdir, "session.log")
+        wrapper = [sys.executable, "-c",
+                   "import json, os, sys\n"
+                   "for line in sys.stdin:\n"
+                   "    req = json.loads(line)\n"
+                   f"    with open({log!r}, 'a') as f: f.write(f'{{os.getpid()}} {{req[\"prompt\"]}}\\n')\n"
+                   "    sel = None if req['prompt'] == 'Cancel' else req['input'].split()[-1]\n"
+                   "    print(json.dumps({'selection': sel}), flush=True)\n"]
+        self.addCleanup(setattr, KM, "SETTINGS", KM.SETTINGS)
+        KM.SETTINGS = KM.settings.Settings(
+            launcher=KM.menu.LauncherProfile(("dmenu",), session_argv=tuple(wrapper)))
+        with mock.patch("keepmenu.menu.run") as run:
+            with KM.menu.launcher_session() as session:
+                self.assertEqual(KM.menu.dmenu_select(2, "Password", inp="a\nb\n"), "b")
+                with KM.menu.launcher_session() as inner:
+                    self.assertIs(inner, session)
+                    self.assertEqual(KM.menu.dmenu_select(1, "Cancel", inp="c"), "")
+                self.assertEqual(KM.menu.dmenu_select(2, inp=iter(["d", "e"])), "e")
+                proc = session.proc
+            self.assertFalse(run.called)
+        self.assertIsNotNone(proc.returncode)
+        self.assertIsNone(KM.menu.SESSION)
+        with open(log, encoding="utf-8") as lfile:
+            pids, prompts = zip(*(i.split() for i in lfile))
+        self.assertEqual(len(set(pids)), 1)
+        self.assertEqual(prompts, ("Password", "Cancel", "Entries"))
+        KM.SETTINGS = KM.settings.Settings(
+            launcher=KM.menu.LauncherProfile(("dmenu",), session_argv=(sys.executable, "-c", "")))
+        with KM.menu.launcher_session() as session, \
+                mock.patch("keepmenu.menu.run") as run, \
+                mock.patch("sys.stderr"):
+            run.return_value = subprocess.CompletedProcess([], 0, "x\n", "")
+            self.assertEqual(KM.menu.dmenu_select(1, inp=iter(["x", "y"])), "x")
+            self.assertEqual(run.call_args.kwargs["input"], "x\ny")
+            self.assertEqual(KM.menu.dmenu_select(1, inp="x"), "x")
+            self.assertTrue(session.failed)
+            self.assertEqual(run.call_count, 2)
+
+    def test_probe_cache(self):
+        """Test clipboard/typing tool probes are cached in the runtime dir and
+        only re-run with reprobe
+
+        """
+        copyfile("tests/keepmenu-config.ini", KM.CONF_FILE)
+        with mock.patch.dict(os.environ, {"XDG_RUNTIME_DIR": self.tmpdir}), \
+                mock.patch("keepmenu.run") as run:
+            KM.reload_config()
+            self.assertTrue(run.called)
+            self.assertTrue(os.path.exists(os.path.join(self.tmpdir, "keepmenu", KM.PROBE_FILE)))
+            run.reset_mock()
+            KM.reload_config()
+            self.assertFalse(run.called)
+            KM.reload_config(reprobe=True)
+            self.assertTrue(run.called)
+
     def test_get_password_conf(self):
         """Test proper reading of password config names with spaces
 
@@ -196,6 +308,81 @@ class TestFunctions(unittest.TestCase):
                         KM.CONF.get("password_char_presets", "Minimal Punc") ==
                         'upper lower digits "punc min"')
 
+    def test_settings(self):
+        """Test config values are parsed and validated once into SETTINGS
+
+        """
+        copyfile("tests/keepmenu-config.ini", KM.CONF_FILE)
+        KM.reload_config()
+        self.assertEqual(KM.SETTINGS.type_library, "xdotool")
+        self.assertEqual(KM.SETTINGS.hide_groups, ("Recycle Bin", "Test"))
+        self.assertIsNone(KM.SETTINGS.title_path)
+        self.assertFalse(KM.SETTINGS.type_url)
+        self.assertEqual(dict(KM.SETTINGS.password_presets),
+                         {"Minimal Punc": (("upper", string.ascii_uppercase),
+                                           ("lower", string.ascii_lowercase),
+                                           ("digits", string.digits),
+                                           ("punc min", "!@#$%"))})
+        KM.CONF.set("database", "type_library", "bogus")
+        KM.CONF.set("database", "type_url", "maybe")
+        KM.CONF.set("dmenu", "title_path", "20")
+        KM.CONF.set("password_char_presets", "Bad", "upper nothing")
+        settings, errors = KM.settings.Settings.from_config(KM.CONF)
+        self.assertEqual(len(errors), 3)
+        self.assertEqual(settings.type_library, "pynput")
+        self.assertFalse(settings.type_url)
+        self.assertEqual(settings.title_path, 20)
+        self.assertNotIn("Bad", dict(settings.password_presets))
+
+    def test_config_hot_reload(self):
+        """Test the daemon reloads a changed config file and keeps the previous
+        settings if the new one is broken
+
+        """
+        copyfile("tests/keepmenu-config.ini", KM.CONF_FILE)
+        KM.reload_config()
+        runner = mock.Mock()
+        runner.conf_file = None
+        runner.config_watcher = KM.settings.ConfigWatcher(KM.CONF_FILE)
+        KM.keepmenu.DmenuRunner._check_config(runner)  # pylint: disable=protected-access
+        self.assertFalse(runner._update_server_db_state.called)
+        with open(KM.CONF_FILE, 'a', encoding=KM.ENC) as conf_file:
+            conf_file.write("\n[database]\ntype_library = wtype\n")
+        KM.keepmenu.DmenuRunner._check_config(runner)  # pylint: disable=protected-access
+        # Duplicate section: previous settings are kept
+        self.assertEqual(KM.SETTINGS.type_library, "xdotool")
+        # --show in the daemon doesn't read the broken file again
+        dbo = KM.keepmenu.DataBase(dbase="tests/test.kdbx",
+                                   kpo=PyKeePass("tests/test.kdbx", "password"))
+        run_once.run_once(db=dbo, show="Test Title 1", return_errors=True)
+        self.assertEqual(KM.SETTINGS.type_library, "xdotool")
+        KM.CONF.set("database", "type_library", "pynput")
+        KM.CONF.set("database", "pw_cache_period_min", "20")
+        with open(KM.CONF_FILE, 'w', encoding=KM.ENC) as conf_file:
+            KM.CONF.write(conf_file)
+        KM.keepmenu.DmenuRunner._check_config(runner)  # pylint: disable=protected-access
+        self.assertEqual(KM.SETTINGS.type_library, "pynput")
+        self.assertEqual(KM.CACHE_PERIOD_MIN, 20)
+        self.assertTrue(runner._update_server_db_state.called)
+        self.assertTrue(runner._set_timer.called)
+        # Invalid numbers are reported by the settings validation
+        KM.CONF.set("database", "pw_cache_period_min", "abc")
+        with open(KM.CONF_FILE, 'w', encoding=KM.ENC) as conf_file:
+            KM.CONF.write(conf_file)
+        with mock.patch("keepmenu.menu.dmenu_err") as err:
+            KM.keepmenu.DmenuRunner._check_config(runner)  # pylint: disable=protected-access
+        self.assertIn("pw_cache_period_min", err.call_args.args[0])
+        self.assertEqual(KM.CACHE_PERIOD_MIN, KM.CACHE_PERIOD_DEFAULT_MIN)
+        # Any other error while reloading keeps the previous settings
+        previous = KM.CONF
+        with mock.patch("keepmenu.settings.Settings.from_config", side_effect=ValueError("x")), \
+                mock.patch("keepmenu.keepmenu.dmenu_err") as err:
+            with open(KM.CONF_FILE, 'a', encoding=KM.ENC) as conf_file:
+                conf_file.write("\n")
+            KM.keepmenu.DmenuRunner._check_config(runner)  # pylint: disable=protected-access
+        self.assertIs(KM.CONF, previous)
+        self.assertTrue(err.called)
+
     def test_generate_password(self):
         """Test gen_passwd function
 
@@ -330,6 +517,40 @@ class TestFunctions(unittest.TestCase):
         self.assertEqual(db1.__dict__, databases[0].__dict__)
         self.assertEqual(db2.__dict__, databases[1].__dict__)
 
+    def test_password_cmd_cache(self):
+        """Test password commands run only for the opened database and are
+        cached
+
+        """
+        log = os.path.join(self.tmpdir, "cmd.log")
+        conf = configparser.ConfigParser()
+        conf.read_dict({"database": {
+            f"database_{i}": os.path.join(self.tmpdir, f"test{i}.kdbx") for i in (1, 2)}})
+        for i in (1, 2):
+            conf.set("database", f"password_cmd_{i}",
+                     f"sh -c 'echo {i} >> {log}; echo password{i}'")
+        self.addCleanup(setattr, KM, "SETTINGS", KM.SETTINGS)
+        self.addCleanup(setattr, KM, "CONF", KM.CONF)
+        KM.CONF = conf
+        KM.SETTINGS = KM.settings.Settings(password_cmd_cache_min=5)
+
+        def runs():
+            with open(log, encoding=KM.ENC) as fin:
+                return fin.read().split()
+
+        with mock.patch.object(KM.passcmd, "CACHE", KM.passcmd.PasswordCommands()):
+            dbs = KM.keepmenu.get_databases(resolve=False)
+            self.assertEqual([i.pword for i in dbs], [None, None])
+            self.assertFalse(os.path.exists(log))
+            KM.keepmenu.resolve_passwords(dbs[1:])
+            self.assertEqual((dbs[1].pword, runs()), ("password2", ["2"]))
+            self.assertEqual([i.pword for i in KM.keepmenu.get_databases()],
+                             ["password1", "password2"])
+            self.assertEqual(sorted(runs()), ["1", "2"])
+            KM.SETTINGS = KM.settings.Settings(password_cmd_cache_min=0)
+            KM.keepmenu.resolve_passwords(dbs)
+            self.assertEqual(sorted(runs()), ["1", "1", "2", "2"])
+
     def test_open_database(self):
         """Test database opens properly
 
@@ -391,6 +612,32 @@ class TestFunctions(unittest.TestCase):
         self.assertEqual(ref_entry.deref("url"), base_entry.url)
         self.assertEqual(ref_entry.deref("notes"), base_entry.notes)
 
+    def test_deref_cache(self):
+        """Test resolved references are cached, invalidated through the
+        reverse dependencies and reference cycles don't recurse
+
+        """
+        kpo = PyKeePass("tests/test.kdbx", "password")
+        ref_entry = kpo.find_entries_by_title(title='.*REF.*', regex=True)[0]
+        base_entry = kpo.find_entries_by_title(title='Test Title 1')[0]
+        self.assertEqual(KM.safe_deref(ref_entry, "username"), base_entry.username)
+        with mock.patch.object(kpo, "find_entries", wraps=kpo.find_entries) as find:
+            self.assertEqual(KM.safe_deref(ref_entry, "username"), base_entry.username)
+            self.assertFalse(find.called)
+        base_entry.username = "changed"
+        self.assertEqual(KM.deref.invalidate(base_entry), {base_entry.uuid, ref_entry.uuid})
+        self.assertEqual(KM.safe_deref(ref_entry, "username"), "changed")
+        entry1 = kpo.add_entry(kpo.root_group, "Cycle 1", "user", "pw")
+        entry2 = kpo.add_entry(kpo.root_group, "Cycle 2", f"{{REF:U@I:{entry1.uuid.hex}}}", "pw")
+        entry1.username = f"{{REF:U@I:{entry2.uuid.hex}}}"
+        self.assertEqual(KM.safe_deref(entry1, "username"), "")
+        self.assertEqual(KM.safe_deref(entry2, "username"), "")
+        # The cache doesn't keep its database alive
+        ref = weakref.ref(kpo)
+        del kpo, ref_entry, base_entry, entry1, entry2, find
+        gc.collect()
+        self.assertIsNone(ref())
+
     def test_additional_attributes(self):
         """Test if additional attributes are correctly accessed
 
@@ -426,6 +673,203 @@ class TestFunctions(unittest.TestCase):
         expiring_entries = KM.keepmenu.get_expiring_entries(kpo.entries)
         self.assertEqual(len(expiring_entries), 1)
 
+    def test_frecency(self):
+        """Test usage ordering of entries keeps the entry numbers
+
+        """
+        kpo = PyKeePass("tests/test.kdbx", "password")
+        entries = kpo.entries[:5]
+        store = KM.frecency.FrecencyStore(os.path.join(self.tmpdir, "state", "frecency.json"))
+        self.assertEqual(store.order("db", entries), [0, 1, 2, 3, 4])
+        store.record("db", entries[3], now=0)
+        store.record("db", entries[1], now=0)
+        store.record("db", entries[1], now=0)
+        store.record("db", entries[4], now=KM.frecency.HALF_LIFE_DAYS * 86400 * 2)
+        self.assertEqual(store.order("db", entries, now=KM.frecency.HALF_LIFE_DAYS * 86400 * 2),
+                         [4, 1, 3, 0, 2])
+        with open(store.path, encoding="utf-8") as sfile:
+            self.assertNotIn(entries[1].title, sfile.read())
+        # A second process sees the recorded usage
+        self.assertEqual(KM.frecency.FrecencyStore(store.path).order(
+            "db", entries, now=KM.frecency.HALF_LIFE_DAYS * 86400 * 2), [4, 1, 3, 0, 2])
+        KM.reload_config()
+        KM.SETTINGS = KM.settings.Settings(frecency=True)
+        self.addCleanup(KM.reload_config)
+        store = KM.frecency.FrecencyStore(os.path.join(self.tmpdir, "frecency.json"))
+        store.record("db", entries[4])
+        store.record("db", entries[2])
+        store.record("db", entries[2])
+        with mock.patch.object(KM.frecency, "STORE", store), \
+                mock.patch("keepmenu.view.dmenu_select") as select:
+            KM.view.view_all_entries([], entries, "db")
+            lines = list(select.call_args.kwargs['inp'])
+            self.assertEqual([int(i.split(" - ")[0]) for i in lines], [2, 4, 0, 1, 3])
+            # Single --show-batch matches are recorded, ambiguous ones aren't
+            with mock.patch.object(store, "save", wraps=store.save) as save:
+                KM.run_once.show_batch(kpo.entries, ["Backblaze B2", "Duo", "fred60"],
+                                       dbase="db")
+            self.assertEqual(save.call_count, 1)
+            self.assertIn(kpo.entries[11].uuid.hex, store.data["db"])
+            self.assertEqual(len(store.data["db"]), 4)
+
+    def test_index_output(self):
+        """Test selecting entries by the index printed by the launcher
+
+        """
+        kpo = PyKeePass("tests/test.kdbx", "password")
+        entries = kpo.entries[:3]
+
+        def profile(command):
+            conf = configparser.ConfigParser()
+            conf.read_dict({"dmenu": {"dmenu_command": command}})
+            return KM.menu.LauncherProfile.from_config(conf)
+        self.assertEqual(profile("rofi -dmenu").command(5, "Entries", index=True)[-2:],
+                         ["-format", "i"])
+        self.assertEqual(profile("rofi -dmenu -format s").index_args, ())
+        self.assertEqual(profile("bemenu").index_args, ())
+        settings = KM.SETTINGS
+        self.addCleanup(setattr, KM, "SETTINGS", settings)
+        KM.SETTINGS = KM.settings.Settings(launcher=profile("fuzzel --dmenu"))
+        with mock.patch("keepmenu.view.dmenu_select") as select:
+            select.return_value = "2"
+            self.assertIs(KM.view.view_all_entries(["Opt 1", "Opt 2"], entries, "db"),
+                          entries[0])
+            lines = list(select.call_args.kwargs['inp'])
+            self.assertTrue(select.call_args.kwargs['index'])
+            self.assertEqual(lines[2], f"{entries[0].title} - {entries[0].username} - "
+                             f"{entries[0].url or ''}")
+            select.return_value = "1"
+            self.assertEqual(KM.view.view_all_entries(["Opt 1", "Opt 2"], entries, "db"),
+                             "Opt 2")
+            for sel in ("-1", "5", "Typed text", ""):
+                select.return_value = sel
+                self.assertIsNone(KM.view.view_all_entries(["Opt 1"], entries, "db"))
+
+    def test_group_browser(self):
+        """Test drilling down through groups one level per menu
+
+        """
+        kpo = PyKeePass("tests/test.kdbx", "password")
+        entries = kpo.entries
+        self.addCleanup(setattr, KM, "SETTINGS", KM.SETTINGS)
+        KM.SETTINGS = KM.settings.Settings(group_browser=True)
+        menus = []
+
+        def select(num_lines, prompt="Entries", inp="", index=False):  # pylint: disable=unused-argument
+            menus.append(list(inp) if not isinstance(inp, str) else inp.split("\n"))
+            return responses.pop(0)
+
+        responses = ["Work/", "..", "Work/", "HR/", "18 - Work/HR/Duo"]
+        with mock.patch("keepmenu.view.dmenu_select", select):
+            self.assertIs(KM.view.view_all_entries(["Opt"], entries, "db"), entries[18])
+        self.assertEqual(menus[0][0], "Opt")
+        self.assertIn("Work/", menus[0])
+        self.assertEqual(len([i for i in menus[0] if " - " in i]), 3)
+        self.assertEqual(menus[1], ["..", "Auth/", "HR/"])
+        self.assertEqual(len(menus[4]), 2)
+        # Hidden groups are pruned
+        menus.clear()
+        responses = [""]
+        with mock.patch("keepmenu.view.dmenu_select", select):
+            KM.view.view_all_entries([], [i for i in entries if "Work" not in i.path], "db")
+        self.assertNotIn("Work/", menus[0])
+        work = kpo.find_groups(name="Work", first=True)
+        menus.clear()
+        responses = ["Work/", "[Work]"]
+        with mock.patch("keepmenu.groups.dmenu_select", select):
+            self.assertEqual(KM.edit.select_group(kpo).uuid, work.uuid)
+            responses = ["Work/"]
+            self.assertFalse(KM.edit.select_group(kpo, exclude_group=work))
+        self.assertEqual(menus[0][0], "[Root]")
+        self.assertNotIn("Work/", menus[-1])
+
+    def test_window_match(self):
+        """Test matching entries against the focused window title
+
+        """
+        kpo = PyKeePass("tests/test.kdbx", "password")
+        entries = kpo.entries
+        index = KM.window.WindowIndex(entries)
+        self.assertEqual(index.match("Google - Mozilla Firefox"), [entries[3], entries[5]])
+        self.assertEqual(index.match("Sign in | Test Title 2 - Chromium"), [entries[3], entries[5]])
+        self.assertEqual(index.match("Backblaze B2 Cloud"), [entries[11]])
+        self.assertEqual(index.match("Testing titles"), [])
+        self.assertEqual(index.match(None), [])
+        self.assertEqual(index.associated("Google - Mozilla Firefox"), [])
+        entries[13].autotype_window = "*Terminal*"
+        index = KM.window.WindowIndex(entries)
+        self.assertEqual(index.match("bash - terminal"), [entries[13]])
+        self.assertEqual(index.associated("bash - terminal"), [entries[13]])
+        self.assertEqual(KM.window.url_label("https://www.github.com/login"), "github")
+        self.assertIsNone(KM.window.url_label("http://192.168.1.1"))
+        with mock.patch.dict(os.environ, {"KEEPMENU_WINDOW_TITLE": "Google"}):
+            self.assertEqual(KM.window.active_title("fake"), "Google")
+        tree = {"type": "root", "nodes": [{"type": "con", "name": "a", "nodes": [
+            {"type": "con", "focused": True, "name": "Google - Firefox"}]}]}
+        with mock.patch("keepmenu.window.run") as run:
+            run.return_value = subprocess.CompletedProcess([], 0, json.dumps(tree), "")
+            self.assertEqual(KM.window.active_title("sway"), "Google - Firefox")
+        # Matches are listed first
+        self.addCleanup(setattr, KM, "SETTINGS", KM.SETTINGS)
+        KM.SETTINGS = KM.settings.Settings()
+        with mock.patch("keepmenu.view.dmenu_select") as select:
+            KM.view.view_all_entries(["Opt"], entries, "db", top=[entries[5], entries[3]])
+            lines = list(select.call_args.kwargs['inp'])
+        self.assertEqual([i.split(" - ")[0].strip() for i in lines[:4]], ["Opt", "3", "5", "0"])
+
+    def test_paging(self):
+        """Test entry lists split into pages with group drill-down
+
+        """
+        kpo = PyKeePass("tests/test.kdbx", "password")
+        entries = kpo.entries
+        self.addCleanup(setattr, KM, "SETTINGS", KM.SETTINGS)
+        KM.SETTINGS = KM.settings.Settings(page_size=2)
+        pages = []
+
+        def select(num_lines, prompt="Entries", inp="", index=False):  # pylint: disable=unused-argument
+            if prompt == "Groups":
+                pages.append(inp.split("\n"))
+                return "/".join(entries[-1].path[:-1])
+            pages.append(list(inp))
+            return responses.pop(0)
+
+        responses = [KM.view.MORE, KM.view.MORE, " 4 - whatever"]
+        with mock.patch("keepmenu.view.dmenu_select", select):
+            self.assertIs(KM.view.view_all_entries(["Opt"], entries, "db"), entries[4])
+            self.assertEqual(pages[0][0], "Opt")
+            self.assertEqual(pages[0][-2:], [KM.view.MORE, KM.view.BROWSE_GROUPS])
+            self.assertEqual([len(i) for i in pages], [5, 4, 4])
+            self.assertTrue(pages[2][0].lstrip().startswith("4 - "))
+            pages.clear()
+            responses = [KM.view.BROWSE_GROUPS, KM.view.BROWSE_GROUPS, ""]
+            self.assertIsNone(KM.view.view_all_entries(["Opt"], entries, "db"))
+            group = "/".join(entries[-1].path[:-1])
+            self.assertIn(group, pages[1])
+            self.assertTrue(all(f" - {group}" in i or i in (KM.view.MORE, KM.view.BROWSE_GROUPS)
+                                for i in pages[2]))
+
+    def test_expiry_index(self):
+        """Test incremental updates of the expiry index
+
+        """
+        kpo = PyKeePass("tests/test.kdbx", "password")
+        index = KM.expiry.ExpiryIndex(kpo.entries)
+        self.assertEqual(len(index.expiring()), 1)
+        entry = kpo.find_entries(title='Test Title 1', first=True)
+        entry.expires = True
+        entry.expiry_time = datetime.now(timezone.utc) + timedelta(days=2)
+        index.update(entry)
+        self.assertIn(entry, index.expiring())
+        entry.expiry_time = datetime.now(timezone.utc) + timedelta(days=4)
+        index.update(entry)
+        self.assertEqual(len(index.expiring()), 1)
+        # Crossing the horizon
+        with mock.patch.object(KM.expiry, "EXPIRY_HORIZON", timedelta(days=5)):
+            self.assertIn(entry, index.expiring())
+            index.remove(entry)
+            self.assertNotIn(entry, index.expiring())
+
     def test_tokenize_autotype(self):
         """Test tokenizing autotype strings
         """
@@ -729,6 +1173,420 @@ class TestFunctions(unittest.TestCase):
         self.assertIsNotNone(result)
         self.assertTrue(result.startswith('ERROR:'))
 
+    def test_show_batch(self):
+        """Test --show-batch returns one JSON result per query
+
+        """
+        db_name = os.path.join(self.tmpdir, "test.kdbx")
+        copyfile("tests/test.kdbx", db_name)
+        copyfile("tests/keepmenu-config.ini", KM.CONF_FILE)
+        KM.reload_config()
+        with open(KM.CONF_FILE, 'w', encoding=KM.ENC) as conf_file:
+            KM.CONF.set('database', 'database_1', db_name)
+            KM.CONF.set('database', 'password_1', 'password')
+            KM.CONF.write(conf_file)
+        KM.reload_config()
+
+        result = run_once.run_once(database=db_name,
+                                   show_batch=['fred60', 'Test', 'nonexistent_xyz_123'],
+                                   return_errors=True)
+        lines = [json.loads(i) for i in result.split('\n')]
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(lines[0]['query'], 'fred60')
+        self.assertEqual(lines[0]['fields'], {'password': 'MkBHbBCozc'})
+        self.assertEqual(lines[1]['error'], 'ambiguous')
+        self.assertTrue(len(lines[1]['matches']) > 1)
+        self.assertEqual(lines[2]['error'], 'no_match')
+
+    def test_show_fields(self):
+        """Test --fields returns the requested fields of the matched entry
+
+        """
+        db_name = os.path.join(self.tmpdir, "test.kdbx")
+        copyfile("tests/test.kdbx", db_name)
+        copyfile("tests/keepmenu-config.ini", KM.CONF_FILE)
+        KM.reload_config()
+        with open(KM.CONF_FILE, 'w', encoding=KM.ENC) as conf_file:
+            KM.CONF.set('database', 'database_1', db_name)
+            KM.CONF.set('database', 'password_1', 'password')
+            KM.CONF.write(conf_file)
+        KM.reload_config()
+
+        result = run_once.run_once(database=db_name, show='fred60',
+                                   fields='username,password')
+        self.assertEqual(json.loads(result), {'username': 'fred60', 'password': 'MkBHbBCozc'})
+        result = run_once.run_once(database=db_name, show='Additional Attributes',
+                                   fields='title,S:Attr 1')
+        self.assertEqual(json.loads(result), {'title': 'Additional Attributes', 'S:Attr 1': 'one'})
+        result = run_once.run_once(database=db_name, show='fred60', fields='bogus',
+                                   return_errors=True)
+        self.assertTrue(result.startswith('ERROR:'))
+        self.assertRaises(ValueError, run_once.parse_fields, 'S:')
+
+    def test_query_language(self):
+        """Test field qualified queries for --show
+
+        """
+        terms = KM.query.compile_query('group:infra user:=deploy url:*.corp title:"db prod" x*')
+        self.assertEqual(terms, (KM.query.Term('group', 'contains', 'infra'),
+                                 KM.query.Term('username', 'exact', 'deploy'),
+                                 KM.query.Term('url', 'glob', '*.corp'),
+                                 KM.query.Term('title', 'contains', 'db prod'),
+                                 KM.query.Term(None, 'prefix', 'x')))
+        self.assertEqual(KM.query.compile_query('Scotty/Backblaze B2'), ())
+
+        kpo = PyKeePass("tests/test.kdbx", "password")
+        index = KM.query.EntryIndex(kpo.entries)
+        self.assertEqual(len(index.search('title:=duo')), 5)
+        res = index.search('group:=work/auth user:user1')
+        self.assertEqual(len(res), 1)
+        self.assertEqual(res[0].path, ['Work', 'Auth', 'Duo'])
+        self.assertEqual(len(index.search('group:work* user:=user2@domain2.tld')), 1)
+        self.assertEqual(len(index.search('url:*.info/')), 3)
+        uuid = kpo.find_entries(title='Backblaze B2', first=True).uuid
+        res = index.search(f'uuid:{uuid}')
+        self.assertEqual([i.uuid for i in res], [uuid])
+        # Unqualified queries keep the original semantics
+        self.assertEqual(len(index.search('Scotty/Backblaze B2')), 1)
+        self.assertEqual(len(index.search('duo user1')), 3)
+        # Index updates
+        entry = res[0]
+        entry.title = "Renamed"
+        index.update(entry)
+        self.assertEqual(index.search('title:=backblaze b2'), [])
+        self.assertEqual(index.search('title:=renamed'), [entry])
+        index.remove(entry)
+        self.assertEqual(index.search('title:renamed'), [])
+
+    def test_fulltext_search(self):
+        """Test full text search over notes and custom attributes
+
+        """
+        kpo = PyKeePass("tests/test.kdbx", "password")
+        self.assertEqual(KM.query.EntryIndex(kpo.entries, fulltext=False).search('pretend'), [])
+        index = KM.query.EntryIndex(kpo.entries, fulltext=True)
+        res = index.search('pretend ssh')
+        self.assertEqual([i.title for i in res], ['Backup user SSH key'])
+        self.assertEqual([i.title for i in index.search('one')], ['Additional Attributes'])
+        # OTP secrets and protected attributes are never indexed
+        self.assertEqual(index.search('ZYTYYE5FOAGW5ML7LRWUL4WTZLNJAMZS'), [])
+        self.assertEqual(index.search('four'), [])
+        # Title hits outrank notes hits
+        entry = kpo.find_entries(title='Backblaze Help', first=True)
+        entry.notes = "see also pretend"
+        index.update(entry)
+        entry = kpo.find_entries(title='Backblaze B2', first=True)
+        entry.title = "Pretend"
+        index.update(entry)
+        res = index.search('pretend')
+        self.assertEqual([i.title for i in res], ['Pretend', 'Backblaze Help', 'Backup user SSH key'])
+        entry.title = "Backblaze B2"
+        index.update(entry)
+        self.assertEqual(len(index.search('pretend')), 2)
+
+    def test_result_cache(self):
+        """Test the LRU cache of --show search results
+
+        """
+        kpo = PyKeePass("tests/test.kdbx", "password")
+        index = KM.query.EntryIndex(kpo.entries)
+        cache = KM.query.ResultCache(maxsize=2)
+        cached = KM.query.CachedIndex(index, cache, "test.kdbx", 1)
+        res = cached.search('fred60')
+        self.assertEqual(len(res), 1)
+        self.assertEqual(cached.search('FRED60'), res)
+        self.assertEqual(cache.stats(), {'hits': 1, 'misses': 1, 'size': 1, 'maxsize': 2})
+        # A new generation never hits entries cached for the old one
+        cached = KM.query.CachedIndex(index, cache, "test.kdbx", 2)
+        self.assertEqual(cached.search('fred60'), res)
+        self.assertEqual(cache.misses, 2)
+        # Deleted entries are never returned
+        index.remove(res[0])
+        self.assertEqual(cached.search('fred60'), [])
+        self.assertEqual(cache.misses, 3)
+        cached.search('joe')
+        self.assertEqual(cache.stats()['size'], 2)
+
+    def test_url_index(self):
+        """Test --url lookups by host and path
+
+        """
+        kpo = PyKeePass("tests/test.kdbx", "password")
+        entries = kpo.entries
+        entries[0].url = "https://www.example.com:8443/"
+        entries[8].url = "login.example.com/sso/"
+        entries[2].url = "http://login.example.com/"
+        entries[7].url = "https://example.co.uk"
+        index = KM.query.UrlIndex(entries)
+        self.assertEqual(index.lookup("https://google.com/search?q=x"), [entries[3], entries[5]])
+        self.assertEqual(index.lookup("EXAMPLE.com"), [entries[0]])
+        self.assertEqual(index.lookup("http://a.b.example.com/x"), [entries[0]])
+        self.assertEqual(index.lookup("https://login.example.com/sso/start"), [entries[8]])
+        self.assertEqual(index.lookup("https://login.example.com/other"), [entries[2]])
+        self.assertEqual(index.lookup("https://shop.example.co.uk/"), [entries[7]])
+        self.assertEqual(index.lookup("https://co.uk/"), [])
+        entries[12].url = "https://box.io"
+        index.update(entries[12])
+        self.assertEqual(index.lookup("https://app.box.io/login"), [entries[12]])
+        self.assertEqual(KM.query.registrable_domain("login.abc.de"), "abc.de")
+        self.assertEqual(KM.query.registrable_domain("shop.example.com.au"), "example.com.au")
+        self.assertEqual(index.lookup("not a url"), [])
+        entries[8].url = ""
+        index.update(entries[8])
+        self.assertEqual(index.lookup("https://login.example.com/sso/start"),
+                         [entries[2]])
+        index.remove(entries[0])
+        self.assertEqual(index.lookup("https://example.com"), [])
+        res = run_once.run_once(db=KM.keepmenu.DataBase(dbase="tests/test.kdbx", kpo=kpo),
+                                url="https://keepass.info/download.html", return_errors=True)
+        self.assertTrue(res.startswith("ERROR: Multiple entries"))
+        res = run_once.run_once(db=KM.keepmenu.DataBase(dbase="tests/test.kdbx", kpo=kpo),
+                                url="https://shop.example.co.uk/", fields="title")
+        self.assertEqual(json.loads(res), {"title": entries[7].title})
+
+    def _make_runner(self, database, open_databases=None):
+        """Return a DmenuRunner with the state set up by __init__, without
+        reading the config or opening databases
+
+        """
+        runner = KM.keepmenu.DmenuRunner.__new__(KM.keepmenu.DmenuRunner)
+        runner.conf_file = None
+        runner.config_watcher = KM.settings.ConfigWatcher(KM.CONF_FILE)
+        runner.server = mock.Mock()
+        runner.server.totp_flag.is_set.return_value = False
+        runner.shared_state = mock.Mock()
+        runner.database = database
+        runner.open_databases = open_databases or {database.dbase: database}
+        runner.prev_entry = None
+        runner.expiry_indexes = {}
+        runner.indexes = {}
+        runner.generations = {}
+        runner.result_cache = KM.query.ResultCache()
+        runner.window_indexes = {}
+        runner.url_indexes = {}
+        runner.unlock_pool = None
+        runner.unlocked = KM.keepmenu.Queue()
+        runner.usage = KM.eviction.DatabaseUsage()
+        runner.scope = ((), "")
+        return runner
+
+    def test_group_change_indexes(self):
+        """Test group changes drop every index of the database
+
+        """
+        path = os.path.join(self.tmpdir, "groups.kdbx")
+        copyfile("tests/test.kdbx", path)
+        kpo = PyKeePass(path, "password")
+        runner = self._make_runner(KM.keepmenu.DataBase(dbase=path, kpo=kpo))
+        group = kpo.find_groups(name="Test", first=True)
+        deleted = [i.uuid for i in group.entries]
+        self.assertEqual(len(runner._get_url_index(runner.database)  # pylint: disable=protected-access
+                             .lookup("https://google.com")), 2)
+        self.assertTrue(runner.expiring)
+        KM.keepmenu.deref.resolve(kpo.entries[6], "url")
+        with mock.patch("keepmenu.keepmenu.manage_groups") as manage:
+            manage.side_effect = lambda kpo: kpo.delete_group(group) or group
+            runner.menu_manage_groups()
+        self.assertNotIn(kpo, KM.keepmenu.deref.CACHES)
+        self.assertEqual(runner.generations, {path: 1})
+        found = runner._get_url_index(runner.database).lookup("https://google.com")  # pylint: disable=protected-access
+        self.assertFalse({i.uuid for i in found} & set(deleted))
+        self.assertFalse({i.uuid for i in runner.expiring} & set(deleted))
+
+    def test_merge_databases(self):
+        """Test menus and searches spanning every unlocked database
+
+        """
+        dbs = {}
+        for name in ("personal", "work"):
+            path = os.path.join(self.tmpdir, f"{name}.kdbx")
+            copyfile("tests/test.kdbx", path)
+            dbs[name] = KM.keepmenu.DataBase(dbase=path, kpo=PyKeePass(path, "password"))
+        dbs["personal"].is_active = True
+        runner = self._make_runner(dbs["personal"], {i.dbase: i for i in dbs.values()})
+        self.addCleanup(setattr, KM, "SETTINGS", KM.SETTINGS)
+        self.addCleanup(setattr, KM, "CONF", KM.CONF)
+        KM.SETTINGS = KM.settings.Settings()
+        self.assertEqual(runner._menu_databases(), [dbs["personal"]])  # pylint: disable=protected-access
+        self.assertIsNone(runner._sources())  # pylint: disable=protected-access
+        KM.SETTINGS = KM.settings.Settings(merge_databases=True)
+        entries = runner._visible_entries([])  # pylint: disable=protected-access
+        self.assertEqual(len(entries), 2 * len(dbs["work"].kpo.entries))
+        work_entry = entries[-1]
+        self.assertIs(runner._database_of(work_entry), dbs["work"])  # pylint: disable=protected-access
+        with mock.patch("keepmenu.view.dmenu_select") as select:
+            select.return_value = f"{len(entries) - 1} - whatever"
+            self.assertIs(KM.view.view_all_entries([], entries, runner.database.dbase,
+                                                   sources=runner._sources()),  # pylint: disable=protected-access
+                          work_entry)
+            lines = list(select.call_args.kwargs['inp'])
+        self.assertIn(" - [personal] ", lines[0])
+        self.assertIn(" - [work] Work/HR/Duo", lines[-1])
+        # Edits are saved to the entry's own database
+        with mock.patch("keepmenu.keepmenu.view_all_entries", return_value=work_entry), \
+                mock.patch("keepmenu.keepmenu.edit_entry", return_value=False) as edit, \
+                mock.patch.object(dbs["work"].kpo, "save") as work_save, \
+                mock.patch.object(dbs["personal"].kpo, "save") as personal_save:
+            runner.menu_edit_entries(entries)
+        self.assertIs(edit.call_args.args[0], dbs["work"].kpo)
+        self.assertTrue(work_save.called)
+        self.assertFalse(personal_save.called)
+        self.assertEqual(runner.generations, {dbs["work"].dbase: 1})
+        # One search over both databases
+        index = KM.query.MergedIndex([runner._get_cached_index(i)  # pylint: disable=protected-access
+                                      for i in runner._menu_databases()])  # pylint: disable=protected-access
+        res = run_once.run_once(db=runner.database, show="fred60", index=index,
+                                return_errors=True)
+        self.assertTrue(res.startswith("ERROR: Multiple entries"))
+        self.assertEqual(len(index.search("fred60")), 2)
+
+    def test_preunlock(self):
+        """Test unlocking config-passwordable databases in the background
+
+        """
+        primary = os.path.join(self.tmpdir, "primary.kdbx")
+        second = os.path.join(self.tmpdir, "second.kdbx")
+        copyfile("tests/test.kdbx", primary)
+        copyfile("tests/test.kdbx", second)
+        conf = configparser.ConfigParser()
+        conf.read_dict({"database": {"database_1": primary, "password_1": "password",
+                                     "database_2": second, "password_2": "password",
+                                     "database_3": os.path.join(self.tmpdir, "none.kdbx"),
+                                     "password_3": "password"}})
+        self.addCleanup(setattr, KM, "SETTINGS", KM.SETTINGS)
+        self.addCleanup(setattr, KM, "CONF", KM.CONF)
+        KM.CONF = conf
+        KM.SETTINGS = KM.settings.Settings(preunlock=True)
+        runner = self._make_runner(KM.keepmenu.DataBase(dbase=primary, pword="password",
+                                                        kpo=PyKeePass(primary, "password"),
+                                                        is_active=True))
+        with mock.patch.object(runner, "_update_server_db_state") as update:
+            runner._start_preunlock()  # pylint: disable=protected-access
+            runner.unlocked.put(runner.unlocked.get(timeout=60))
+            runner._publish_unlocked()  # pylint: disable=protected-access
+            runner.unlock_pool.shutdown(wait=True)
+        self.assertTrue(update.called)
+        self.assertEqual(list(runner.open_databases), [primary, second])
+        self.assertIsNotNone(runner.open_databases[second].kpo)
+        self.assertFalse(runner.open_databases[second].is_active)
+
+    def test_eviction(self):
+        """Test locking idle and least recently used databases
+
+        """
+        dbs = {}
+        for name in ("current", "hot", "cold"):
+            path = os.path.join(self.tmpdir, f"{name}.kdbx")
+            copyfile("tests/test.kdbx", path)
+            dbs[name] = KM.keepmenu.DataBase(dbase=path, pword="password",
+                                             kpo=PyKeePass(path, "password"))
+        usage = KM.eviction.DatabaseUsage()
+        for now, name in enumerate(("cold", "hot", "current")):
+            usage.touch(dbs[name], now=now * 100)
+        size = usage.size(dbs["cold"])
+        self.assertGreater(size, os.path.getsize("tests/test.kdbx"))
+        self.assertEqual(usage.victims(dbs.values(), dbs["current"].dbase, now=200), [])
+        self.assertEqual(usage.victims(dbs.values(), dbs["current"].dbase, idle=150, now=200),
+                         [dbs["cold"]])
+        self.assertEqual(usage.victims(dbs.values(), dbs["current"].dbase, budget=size,
+                                       now=200),
+                         [dbs["cold"], dbs["hot"]])
+        stats = usage.stats(list(dbs.values()), now=200)
+        self.assertEqual(stats[dbs["hot"].dbase], {"unlocked": True, "bytes": size, "idle_s": 100})
+        # The runner locks the cold database and reopens it without prompting
+        runner = self._make_runner(copy(dbs["current"]), {i.dbase: i for i in dbs.values()})
+        runner.prev_entry = dbs["cold"].kpo.entries[0]
+        runner.usage = usage
+        runner._get_url_index(dbs["cold"])  # pylint: disable=protected-access
+        self.addCleanup(setattr, KM, "SETTINGS", KM.SETTINGS)
+        self.addCleanup(setattr, KM, "CONF", KM.CONF)
+        KM.SETTINGS = KM.settings.Settings(db_idle_min=1)
+        KM.CONF = configparser.ConfigParser()
+        KM.CONF.add_section("database")
+        usage.touch(dbs["hot"])
+        usage.touch(dbs["current"])
+        usage.used[dbs["cold"].dbase] -= 120
+        runner._evict()  # pylint: disable=protected-access
+        self.assertIsNone(dbs["cold"].kpo)
+        self.assertIsNotNone(dbs["hot"].kpo)
+        self.assertIsNone(runner.prev_entry)
+        self.assertEqual(runner.url_indexes, {})
+        # Still published as open so the client doesn't ask for its password
+        self.assertIn(dbs["cold"].dbase, runner.shared_state.open_database_paths)
+        with mock.patch("keepmenu.keepmenu.get_passphrase") as passphrase:
+            dbo, open_dbs = KM.keepmenu.get_database(runner.open_databases,
+                                                     database=dbs["cold"].dbase)
+        self.assertFalse(passphrase.called)
+        self.assertIsNotNone(dbo.kpo)
+        self.assertIs(open_dbs[dbs["cold"].dbase].kpo, dbo.kpo)
+
+    def test_scope(self):
+        """Test --group/--query scoped entry lists
+
+        """
+        kpo = PyKeePass("tests/test.kdbx", "password")
+        index = KM.query.EntryIndex(kpo.entries)
+
+        def paths(res):
+            return ["/".join(i.path[:-1]) for i in res]
+        self.assertEqual(paths(index.scope(["Work"])), ["Work/Auth", "Work/Auth", "Work/HR"])
+        self.assertEqual(index.scope(["Wor"]), [])
+        self.assertEqual(paths(index.scope(["/hosting/", "work/hr"])),
+                         ["Hosting/Auth", "Hosting/Auth", "Work/HR"])
+        self.assertEqual(paths(index.scope(["Work"], "group:=work/hr")), ["Work/HR"])
+        self.assertEqual(len(index.scope(["Work", "/"])), len(kpo.entries))
+        self.assertEqual(index.scope(query="fred60"), index.search("fred60"))
+        cache = KM.query.ResultCache()
+        cached = KM.query.CachedIndex(index, cache, "test.kdbx", 1)
+        res = cached.scope(["Work"], "duo")
+        self.assertEqual(len(res), 3)
+        self.assertEqual(cached.scope(["work/"], "DUO"), res)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        with mock.patch("sys.argv", ["keepmenu", "-g", "Work", "-g", "Hosting", "-q", "duo"]), \
+                mock.patch("keepmenu.__main__.get_auth", return_value=(0, b"")), \
+                mock.patch("keepmenu.__main__.port_in_use", return_value=False), \
+                mock.patch("keepmenu.__main__.run") as run:
+            KM.__main__.main()
+        self.assertEqual(run.call_args.kwargs["group"], ["Work", "Hosting"])
+        self.assertEqual(KM.keepmenu.DmenuRunner._get_scope(run.call_args.kwargs),
+                         (("Work", "Hosting"), "duo"))
+
+    def test_scope_daemon(self):
+        """Test --group/--query sent to the daemon don't ask for a database
+
+        """
+        dbs = {}
+        conf = configparser.ConfigParser()
+        conf.add_section("database")
+        for idx, name in enumerate(("personal", "work"), 1):
+            path = os.path.join(self.tmpdir, f"{name}.kdbx")
+            copyfile("tests/test.kdbx", path)
+            conf.set("database", f"database_{idx}", path)
+            dbs[name] = KM.keepmenu.DataBase(dbase=path, pword="password",
+                                             kpo=PyKeePass(path, "password"))
+        dbs["personal"].is_active = True
+        self.addCleanup(setattr, KM, "CONF", KM.CONF)
+        KM.CONF = conf
+        runner = self._make_runner(dbs["personal"], {i.dbase: i for i in dbs.values()})
+        with mock.patch("sys.argv", ["keepmenu", "-g", "Work", "-q", "duo"]), \
+                mock.patch("keepmenu.__main__.get_auth", return_value=(0, b"")), \
+                mock.patch("keepmenu.__main__.port_in_use", return_value=False), \
+                mock.patch("keepmenu.__main__.run") as run:
+            KM.__main__.main()
+        with mock.patch("keepmenu.keepmenu.dmenu_select") as select, \
+                mock.patch.object(runner, "dmenu_run") as dmenu_run:
+            runner._run_args(dict(run.call_args.kwargs))  # pylint: disable=protected-access
+        self.assertFalse(select.called)
+        self.assertTrue(dmenu_run.called)
+        self.assertEqual(runner.scope, (("Work",), "duo"))
+        self.assertEqual(len(runner.open_databases), 2)
+        # A failing --reprobe keeps the daemon and its settings
+        with mock.patch("keepmenu.reload_config", side_effect=SystemExit) as reload_config, \
+                mock.patch.object(runner, "dmenu_run") as dmenu_run:
+            runner._run_args({"reprobe": True, "database": None})  # pylint: disable=protected-access
+        self.assertEqual(reload_config.call_args.kwargs, {"reprobe": True})
+        self.assertIs(KM.CONF, conf)
+        self.assertTrue(dmenu_run.called)
 
 if __name__ == "__main__":
     unittest.main()